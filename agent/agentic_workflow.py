@@ -1,8 +1,35 @@
 # agentic_workflow.py
+import json
+import asyncio
+from typing import List, Optional
 from utils.model_loader import ModelLoader
+from utils.plan_html import parse_plan, plan_outline
 from prompt_library.prompt import SYSTEM_PROMPT
 from langgraph.graph import StateGraph, MessagesState, END, START
-from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, HumanMessage, ToolMessage, RemoveMessage
+from tools.calorie_calculator_tool import CalorieCalculatorTool
+from tools.food_db_tool import FoodDBTool
+from tools.recipe_search_tool import RecipeSearchTool
+from tools.nutrition_conversion_tool import NutritionConverterTool
+
+# Stands in for plan HTML of earlier turns; the current plan travels in structured form
+PLAN_STUB = "[Meal plan delivered as HTML; see the current plan outline.]"
+
+
+class ConversationState(MessagesState):
+    """
+    Messages plus what a multi-turn conversation needs to stay bounded:
+    the user profile prompt (and the request it was built from, plus the
+    user it belongs to), a running summary of compacted turns and the latest
+    plan in structured form (see utils.plan_html.parse_plan).
+    """
+    profile: str
+    request: dict
+    user_id: Optional[str]
+    summary: str
+    plan: dict
+
 
 class GraphBuilder:
     def __init__(self, model_provider: str = "groq"):
@@ -15,16 +42,116 @@ class GraphBuilder:
         # System prompt instructs the AI to generate ready-to-render HTML
         self.system_prompt = SystemMessage(content=SYSTEM_PROMPT)
 
-    def agent_function(self, state: MessagesState):
+        # Tools only register themselves when their API credentials are configured
+        self.tools = []
+        self.tools.extend(CalorieCalculatorTool().tool_list)
+        self.tools.extend(FoodDBTool().tool_list)
+        self.tools.extend(RecipeSearchTool().tool_list)
+        self.tools.extend(NutritionConverterTool().tool_list)
+        self.tools_by_name = {t.name: t for t in self.tools}
+        self.llm_with_tools = self.llm.bind_tools(tools=self.tools) if self.tools else self.llm
+
+        agent_config = self.model_loader.config.config.get("agent", {})
+        self.max_tool_rounds = int(agent_config.get("max_tool_rounds", 3))
+        self.tool_timeout = float(agent_config.get("tool_timeout_seconds", 20))
+        self.keep_turns = int(agent_config.get("history_keep_turns", 2))
+        self.max_summary_items = int(agent_config.get("history_summary_items", 10))
+
+    @staticmethod
+    def _tool_rounds(messages) -> int:
+        """Count tool rounds the model has requested since the latest user message."""
+        rounds = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if getattr(message, "tool_calls", None):
+                rounds += 1
+        return rounds
+
+    def _context_prompt(self, state: ConversationState) -> SystemMessage:
+        """System prompt plus the thread's profile, summary and current plan outline."""
+        parts = [SYSTEM_PROMPT]
+        if state.get("profile"):
+            parts.append(f"User profile and plan requirements:\n{state['profile']}")
+        if state.get("summary"):
+            parts.append(f"Summary of earlier conversation:\n{state['summary']}")
+        if state.get("plan", {}).get("days"):
+            parts.append(
+                f"Current plan outline (one line per meal):\n{plan_outline(state['plan'])}\n\n"
+                "For follow-up requests, reply with the complete updated plan as HTML, "
+                "changing only what the request requires."
+            )
+        if len(parts) == 1:
+            return self.system_prompt
+        return SystemMessage(content="\n\n".join(parts))
+
+    @staticmethod
+    def _summary_item(message: BaseMessage) -> Optional[str]:
+        """One summary bullet for a compacted user message."""
+        if not isinstance(message, HumanMessage) or not isinstance(message.content, str):
+            return None
+        text = " ".join(message.content.split())
+        return f"- User asked: {text[:200]}{'...' if len(text) > 200 else ''}"
+
+    def compact_history(self, state: ConversationState):
+        """
+        Keep the prompt for each turn bounded, whatever the conversation length:
+        - tool calls and tool results of finished turns are dropped;
+        - plan HTML of finished turns is replaced by a short stub (the latest plan
+          is carried as an outline in the system prompt instead);
+        - turns older than the last `keep_turns` are folded into a capped summary.
+        """
+        messages = state["messages"]
+        human_positions = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if len(human_positions) <= 1:
+            return {}
+
+        current_turn = human_positions[-1]
+        oldest_kept = human_positions[max(0, len(human_positions) - 1 - self.keep_turns)]
+        updates: List[BaseMessage] = []
+        summary_items: List[str] = []
+        for position, message in enumerate(messages[:current_turn]):
+            if position < oldest_kept:
+                item = self._summary_item(message)
+                if item:
+                    summary_items.append(item)
+                updates.append(RemoveMessage(id=message.id))
+            elif isinstance(message, ToolMessage) or getattr(message, "tool_calls", None):
+                updates.append(RemoveMessage(id=message.id))
+            elif isinstance(message, AIMessage) and message.content != PLAN_STUB:
+                # Same id, so the add_messages reducer replaces the HTML in place
+                updates.append(AIMessage(content=PLAN_STUB, id=message.id))
+
+        result = {"messages": updates} if updates else {}
+        if summary_items:
+            items = [line for line in (state.get("summary") or "").splitlines() if line.startswith("- ")]
+            items.extend(summary_items)
+            dropped = len(items) - self.max_summary_items
+            items = items[-self.max_summary_items:]
+            header = [f"({dropped} earlier requests omitted)"] if dropped > 0 else []
+            result["summary"] = "\n".join(header + items)
+        return result
+
+    async def agent_function(self, state: ConversationState, config: RunnableConfig):
         """
-        Core agent logic: takes conversation state, sends messages to the LLM, 
-        and ensures HTML output is extracted properly.
+        Core agent logic: takes conversation state, sends messages to the LLM,
+        and ensures HTML output is extracted properly. The run config is passed on
+        explicitly (Python < 3.11 does not propagate it across asyncio tasks) so
+        token streaming reaches graph.astream(stream_mode="messages").
         """
-        # Combine system prompt with all previous messages
-        messages = [self.system_prompt] + state["messages"]
-        
-        # Invoke the LLM to generate HTML
-        response = self.llm.invoke(messages)
+        # Combine system prompt (with any thread context) with the kept messages
+        messages = [self._context_prompt(state)] + state["messages"]
+
+        # Once the tool-round budget is spent, use the unbound LLM so it has to answer
+        tools_allowed = self._tool_rounds(state["messages"]) < self.max_tool_rounds
+        llm = self.llm_with_tools if tools_allowed else self.llm
+
+        # Invoke the LLM to generate HTML (or request tool calls)
+        response = await llm.ainvoke(messages, config)
+
+        # Tool requests are kept as-is so the tool node can answer each call id
+        if tools_allowed and getattr(response, "tool_calls", None):
+            return {"messages": [response]}
 
         # Safely extract the HTML content from AI response
         if hasattr(response, "content"):
@@ -34,24 +161,73 @@ class GraphBuilder:
         else:
             html_content = str(response)
 
-        # Return the HTML as the assistant's message
-        return {"messages": [{"role": "assistant", "content": html_content}]}
+        # Return the HTML as the assistant's message, and keep its structure for later turns
+        update = {"messages": [{"role": "assistant", "content": html_content}]}
+        plan = parse_plan(html_content) if isinstance(html_content, str) else {"days": []}
+        if plan["days"]:
+            update["plan"] = plan
+        return update
+
+    async def _run_tool_call(self, tool_call: dict) -> ToolMessage:
+        """
+        Execute a single tool call with a timeout. Failures are reported back to
+        the model as an error payload instead of aborting the whole run.
+        """
+        selected_tool = self.tools_by_name.get(tool_call["name"])
+        if selected_tool is None:
+            result = {"error": f"Unknown tool '{tool_call['name']}'."}
+        else:
+            try:
+                result = await asyncio.wait_for(
+                    selected_tool.ainvoke(tool_call["args"]), timeout=self.tool_timeout
+                )
+            except asyncio.TimeoutError:
+                result = {"error": f"Tool '{tool_call['name']}' timed out after {self.tool_timeout}s."}
+            except Exception as e:
+                result = {"error": f"Tool '{tool_call['name']}' failed: {e}"}
+
+        return ToolMessage(
+            content=json.dumps(result, default=str),
+            tool_call_id=tool_call["id"],
+            name=tool_call["name"],
+        )
+
+    async def tool_function(self, state: ConversationState):
+        """
+        Runs every tool call from the latest AI message concurrently, so a turn
+        with several lookups costs one round-trip instead of one per call.
+        """
+        tool_calls = state["messages"][-1].tool_calls
+        results = await asyncio.gather(*(self._run_tool_call(call) for call in tool_calls))
+        return {"messages": list(results)}
+
+    @staticmethod
+    def route_after_agent(state: ConversationState):
+        """Go to the tool node when the model asked for tools, otherwise finish."""
+        last_message = state["messages"][-1]
+        if getattr(last_message, "tool_calls", None):
+            return "tools"
+        return END
 
-    def build_graph(self):
+    def build_graph(self, checkpointer=None):
         """
-        Builds a simple, single-step graph for generating AI content.
-        Ideal for returning ready-to-render HTML.
+        Builds the agent graph: history is compacted, then the agent may call tools
+        (executed in parallel) for a bounded number of rounds before returning
+        ready-to-render HTML. With a checkpointer, state persists per thread_id.
         """
-        workflow = StateGraph(MessagesState)
+        workflow = StateGraph(ConversationState)
 
-        # Add a single agent node
+        workflow.add_node("compact", self.compact_history)
         workflow.add_node("agent", self.agent_function)
+        workflow.add_node("tools", self.tool_function)
 
-        # Connect start -> agent -> end
-        workflow.add_edge(START, "agent")
-        workflow.add_edge("agent", END)
+        # start -> compact -> agent -> (tools -> agent)* -> end
+        workflow.add_edge(START, "compact")
+        workflow.add_edge("compact", "agent")
+        workflow.add_conditional_edges("agent", self.route_after_agent, ["tools", END])
+        workflow.add_edge("tools", "agent")
 
-        self.graph = workflow.compile()
+        self.graph = workflow.compile(checkpointer=checkpointer)
         return self.graph
 
     def __call__(self):
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+# Multi-process deployment: gunicorn manages one uvicorn worker per core.
+#
+#   gunicorn main:app -c gunicorn.conf.py
+#
+# The app is imported once in the master (preload_app) and forked, so module
+# imports and the read-only data loaded at import (recipe index, food vectors,
+# price table) are shared copy-on-write. Each worker then runs the FastAPI
+# lifespan warmup (connections, background threads, graphs + LLM clients) before
+# it accepts connections. Plan and tool
+# results live in the SQLite shared cache (see utils/shared_cache.py), so every
+# worker sees what any other worker already fetched.
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# LLM generations can take well over gunicorn's 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+graceful_timeout = 30
+keepalive = 5
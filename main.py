@@ -1,14 +1,38 @@
+import os
+import re
+import html
 import json
+import uuid
+import asyncio
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, List, Optional, Dict
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 # This assumes your agent is in this location.
 from agent.agentic_workflow import GraphBuilder
+from utils.config_loader import load_config
+from utils.shared_cache import SharedCache, get_shared_cache
+from utils.recipe_store import get_recipe_store
+from utils.substitution_engine import get_substitution_engine
+from utils.food_tags import dietary_preference_rules, religious_exclusions, strictest_pattern
+from utils.plan_html import (
+    DaySectionStream, MEAL_RE, SHOPPING_LIST_RE, fill_substitutions, minify_html, parse_plan, plan_outline,
+    refresh_day_totals, render_day, render_meal, render_plan, replace_meals, split_days, wrap_plan,
+)
+from utils.meal_planner import get_fast_planner
+from utils.shopping_list import ShoppingListAggregator, get_price_table, render_shopping_list
+from utils.currency_converter import get_currency_converter
+from utils.plan_store import MAX_PAGE_SIZE, PlanStore, get_plan_store
+from utils.compression import CompressionMiddleware
+from utils.replanner import PREFERENCE_FIELDS, TARGET_FIELDS, changed_fields, daily_targets, invalidated_meals, needs_full_replan
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +40,91 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="Nutritionist Meal Suggestion App")
+config = load_config()
+
+# --- COMPILED GRAPH CACHE ---
+# Building a graph creates the LLM client and its connection pool, so each worker
+# builds one graph per provider and reuses it for every request.
+_builder_cache: Dict[str, GraphBuilder] = {}
+_graph_cache: Dict[str, Any] = {}
+_thread_graph_cache: Dict[str, Any] = {}
+# Conversation checkpointer, opened by the lifespan handler
+_checkpointer: Optional[AsyncSqliteSaver] = None
+
+
+def get_graph_builder(model_provider: str = "groq") -> GraphBuilder:
+    """Return the GraphBuilder (LLM client and tools) for a provider, creating it on first use."""
+    if model_provider not in _builder_cache:
+        _builder_cache[model_provider] = GraphBuilder(model_provider=model_provider)
+    return _builder_cache[model_provider]
+
+
+def get_nutrition_app(model_provider: str = "groq"):
+    """Return the compiled, stateless agent graph for a provider, building it on first use."""
+    if model_provider not in _graph_cache:
+        _graph_cache[model_provider] = get_graph_builder(model_provider).build_graph()
+    return _graph_cache[model_provider]
+
+
+def get_thread_app(model_provider: str = "groq"):
+    """Return the agent graph that checkpoints conversation state per thread_id."""
+    if _checkpointer is None:
+        raise RuntimeError("Conversation checkpointer is not open.")
+    if model_provider not in _thread_graph_cache:
+        _thread_graph_cache[model_provider] = get_graph_builder(model_provider).build_graph(checkpointer=_checkpointer)
+    return _thread_graph_cache[model_provider]
+
+
+def preload_data():
+    """
+    Load the read-only data (recipe index, food vectors, fast planner, price table) at
+    import time. Under gunicorn's preload_app this runs once in the master, and the
+    forked workers share the loaded arrays copy-on-write instead of each building them.
+    """
+    get_recipe_store()
+    get_substitution_engine()
+    get_fast_planner()
+    get_price_table()
+
+
+preload_data()
+
+
+def warmup():
+    """
+    Open the per-worker resources (shared cache connection, background threads, plan
+    store, graphs and LLM clients) so a freshly started worker never pays that cost on
+    its first request. Connections and threads do not survive a fork, so this runs in
+    each worker's lifespan rather than at import.
+    """
+    cache_config = config.get("cache", {})
+    get_shared_cache().start_background_purge(int(cache_config.get("purge_interval_seconds", 900)))
+    get_currency_converter().start_background_refresh()
+    get_plan_store()
+    for provider in config.get("server", {}).get("warmup_providers", ["groq"]):
+        try:
+            get_nutrition_app(provider)
+            logger.info(f"🔥 Warmed up graph for provider '{provider}'.")
+        except Exception as e:
+            logger.warning(f"⚠️ Warmup skipped for provider '{provider}': {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _checkpointer
+    # Runs in every worker before it starts accepting connections
+    threads_path = os.getenv("THREAD_STORE_PATH", config.get("threads", {}).get("path", "./cache/threads.sqlite3"))
+    os.makedirs(os.path.dirname(threads_path) or ".", exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(threads_path) as checkpointer:
+        _checkpointer = checkpointer
+        warmup()
+        yield
+        _checkpointer = None
+    # Write any plans still queued for the plan store before the worker exits
+    get_plan_store().close()
+
+
+app = FastAPI(title="Nutritionist Meal Suggestion App", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,10 +132,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the validators and the id of a 304'd plan
+    expose_headers=["ETag", "X-Plan-Id"],
+)
+
+# Brotli/gzip for every response, including the NDJSON stream (flushed per event)
+response_config = config.get("response", {})
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(response_config.get("compression_min_bytes", 500)),
+    gzip_level=int(response_config.get("gzip_level", 6)),
+    brotli_quality=int(response_config.get("brotli_quality", 5)),
 )
 
 # Pydantic model to validate the incoming data from the frontend form
 class NutritionQueryRequest(BaseModel):
+    # Optional caller-supplied id used to list a user's plan history
+    user_id: Optional[str] = None
     age: int
     gender: str
     height_cm: float
@@ -41,7 +162,7 @@ class NutritionQueryRequest(BaseModel):
     dislikes: Optional[List[str]] = []
     likes: Optional[List[str]] = []
     religious_restrictions: Optional[List[str]] = []
-    meals_per_day: int
+    meals_per_day: int = Field(ge=1, le=7)
     eating_window: Optional[Dict[str, str]] = None
     budget: str
     cooking_skill: str
@@ -49,24 +170,80 @@ class NutritionQueryRequest(BaseModel):
     goals: Optional[List[str]] = ["wellness"]
     dietary_preferences: Optional[List[str]] = []
     cuisine_preferences: Optional[List[str]] = []
+    # "llm" (agent), "fast" (local deterministic planner) or "auto" (fast for plain profiles)
+    mode: Optional[str] = "llm"
+    plan_days: Optional[int] = Field(1, ge=1, le=14)
+    # Shopping list cost estimates are shown in this currency
+    currency: Optional[str] = "USD"
 
-@app.post("/query")
-async def query_nutritionist(query: NutritionQueryRequest):
-    """
-    This endpoint receives user data, generates a natural language prompt,
-    invokes the AI agent, and returns the agent's final response.
-    """
-    try:
-        query_data = query.dict()
-        logger.info(f"📥 Received Nutrition Query: {json.dumps(query_data, indent=2)}")
+def profile_data(query: NutritionQueryRequest) -> Dict[str, Any]:
+    """The request without per-user fields: what cache keys and plan fingerprints are built from."""
+    return query.dict(exclude={"user_id"})
+
+
+def save_plan(html_content: str, query: NutritionQueryRequest, source: str) -> str:
+    """Queue a served plan for the plan store (off the request path) and return its id."""
+    return get_plan_store().save(html_content, profile_data(query), user_id=query.user_id, source=source)
+
+
+def stored_plan_id(html_content: str, query: NutritionQueryRequest) -> Optional[str]:
+    """Id under which this plan was already stored for the caller, so a 304 adds no history row."""
+    return get_plan_store().find_plan(PlanStore.content_hash(html_content), profile_data(query), query.user_id)
 
-        # --- 1. BUILD A CLEAN, NATURAL LANGUAGE PROMPT ---
-        # This follows the pattern of your reference Trip Planner app.
-        user_prompt = f"""
-Generate a personalized single-day meal plan for the user as a complete HTML block with Tailwind CSS. Include:
+
+def minify(html_content: str) -> str:
+    """Minify generated HTML before it is post-processed, cached and stored (unless disabled)."""
+    return minify_html(html_content) if response_config.get("minify_html", True) else html_content
+
+
+# --- HTTP CACHING ---
+# ETags are the plan's content hash, the same one the plan store deduplicates by,
+# so a plan has one validator whether it comes from the cache, /query or history.
+def plan_etag(html_content: str) -> str:
+    return f'"{PlanStore.content_hash(html_content)}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check with weak comparison (compressed responses carry W/ ETags)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str, plan_id: Optional[str] = None) -> Response:
+    """304 for a client that already holds this plan; X-Plan-Id names its stored copy when there is one."""
+    headers = {"ETag": etag}
+    if plan_id is not None:
+        headers["X-Plan-Id"] = plan_id
+    return Response(status_code=304, headers=headers)
+
+def add_substitutions(html_content: str, query: NutritionQueryRequest) -> str:
+    """Fill every meal's substitutions placeholder from the nutrient-vector engine."""
+    engine = get_substitution_engine()
+    rules = dietary_preference_rules(query.dietary_preferences or [])
+    return fill_substitutions(
+        html_content,
+        lambda names: engine.substitutes(
+            names,
+            k=3,
+            dietary_pattern=strictest_pattern([query.dietary_pattern, rules["dietary_pattern"]]) or query.dietary_pattern,
+            allergies=(query.allergies or []) + rules["allergies"],
+            # Religious rules exclude foods the same way the planners do
+            dislikes=(query.dislikes or []) + religious_exclusions(query.religious_restrictions or []),
+        ),
+    )
+
+def build_user_prompt(query: NutritionQueryRequest) -> str:
+    """Natural language prompt for the agent, following the pattern of the reference Trip Planner app."""
+    days = f"{query.plan_days}-day" if query.plan_days and query.plan_days > 1 else "single-day"
+    return f"""
+Generate a personalized {days} meal plan for the user as a complete HTML block with Tailwind CSS. Include:
 - Cards for Breakfast, Lunch, Dinner, Snack 1, Snack 2
 - Tables for ingredients, calories, protein, carbs, fat
-- Bullet points for substitutions and tips
+- Bullet points for tips (leave the substitutions placeholder empty)
 -Use Tailwind CSS for headings, tables, etc., directly in HTML. No Markdown or code fences.
 
 
@@ -87,43 +264,481 @@ User Profile:
 **Strict rules:**
 - Only produce **HTML**.  
 - Do **NOT** include JSON, Markdown, reasoning, or explanations.  
-- Include all meals, macros, substitutions, and daily summary.
+- Include all meals, macros, and daily summary; substitutions are added by the server.
 - Ensure the HTML is clean and ready to be rendered directly in a web page.
 """
 
-        logger.info("💡 Generated User Prompt for Agent.")
 
-        # --- 2. INITIALIZE AND INVOKE THE AGENT ---
-        graph_builder = GraphBuilder(model_provider="groq")
-        nutrition_app = graph_builder.build_graph()
-        
-        # The agent expects the prompt in this message format
-        messages = {"messages": [("user", user_prompt)]}
+def use_fast_path(query: NutritionQueryRequest) -> bool:
+    """
+    Resolve the request mode; "auto" sends plain profiles to the local planner. Profiles
+    with dietary preferences it has no rule for (keto, paleo, low-carb) go to the agent.
+    """
+    mode = (query.mode or "llm").lower()
+    if mode != "auto":
+        return mode == "fast"
+    fast_goals = set(config.get("planner", {}).get("fast_path_goals", ["wellness"]))
+    return (
+        not query.medical_conditions
+        and not query.medications
+        and not dietary_preference_rules(query.dietary_preferences or [])["unsupported"]
+        and set(g.lower() for g in query.goals or []) <= fast_goals
+    )
 
-        logger.info("🚀 Invoking agent...")
-        output_state = await nutrition_app.ainvoke(messages)
-        logger.info("✅ Agent run complete.")
 
-        # --- 3. EXTRACT THE FINAL RESPONSE ---
-        final_output = ""
-        if isinstance(output_state, dict) and "messages" in output_state and output_state["messages"]:
-            # Get the content from the very last message in the agent's state
-            last_message = output_state["messages"][-1]
-            if hasattr(last_message, 'content'):
-                final_output = last_message.content
+def generate_fast_plan(query: NutritionQueryRequest) -> str:
+    """Deterministic plan from the local recipe library, rendered to the same HTML contract."""
+    plan = get_fast_planner().plan(query, days=query.plan_days or 1)
+    for warning in plan["warnings"]:
+        logger.warning(f"⚠️ {warning}")
+    return render_plan(plan)
 
-        if not final_output:
-            raise ValueError("AI agent did not produce a final response.")
 
+async def run_agent(user_prompt: str) -> str:
+    """Run the (pre-built) agent on one prompt and return its final answer."""
+    nutrition_app = get_nutrition_app("groq")
+
+    # The agent expects the prompt in this message format
+    messages = {"messages": [("user", user_prompt)]}
+
+    logger.info("🚀 Invoking agent...")
+    output_state = await nutrition_app.ainvoke(messages)
+    logger.info("✅ Agent run complete.")
+
+    final_output = ""
+    if isinstance(output_state, dict) and "messages" in output_state and output_state["messages"]:
+        # Get the content from the very last message in the agent's state
+        last_message = output_state["messages"][-1]
+        if hasattr(last_message, 'content'):
+            final_output = last_message.content
+
+    if not final_output:
+        raise ValueError("AI agent did not produce a final response.")
+    return final_output
+
+
+async def generate_llm_plan(query: NutritionQueryRequest) -> str:
+    """Full plan HTML from the agent."""
+    user_prompt = build_user_prompt(query)
+    logger.info("💡 Generated User Prompt for Agent.")
+    return await run_agent(user_prompt)
+
+
+async def generate_plan(query: NutritionQueryRequest, fast: bool) -> tuple:
+    """(plan HTML, source): the agent's plan, or the fast planner's when asked for or when the agent fails."""
+    if fast:
+        logger.info("🏎️ Building meal plan with the local fast planner.")
+        return minify(generate_fast_plan(query)), "fast"
+    try:
+        final_output = await generate_llm_plan(query)
         logger.info("✅ Successfully extracted final response from agent.")
-        
+        return minify(final_output), "groq"
+    except Exception as e:
+        # Every provider failing should not leave the user without a plan
+        logger.warning(f"⚠️ Agent failed ({e}); falling back to the local fast planner.")
+        return minify(generate_fast_plan(query)), "fast"
+
+def wants_shopping_list(query: NutritionQueryRequest) -> bool:
+    return "shopping_list" in (query.output_wants or [])
+
+
+def add_shopping_list(html_content: str, query: NutritionQueryRequest) -> str:
+    """Append a merged, priced shopping list covering every day of the plan."""
+    aggregator = ShoppingListAggregator()
+    for section in split_days(html_content) or [html_content]:
+        aggregator.add_day(section)
+    shopping_list = render_shopping_list(aggregator.summary(query.currency), days=aggregator.days)
+    return html_content + shopping_list
+
+@app.post("/query")
+async def query_nutritionist(query: NutritionQueryRequest, request: Request):
+    """
+    This endpoint receives user data and returns an HTML meal plan, either from the
+    AI agent or, for fast/auto mode and when the agent fails, from the local planner.
+    The response carries the plan's ETag; a client that sends it back in If-None-Match
+    gets a bodiless 304 (with the new plan id in X-Plan-Id) while the plan is cached.
+    """
+    try:
+        query_data = profile_data(query)
+        logger.info(f"📥 Received Nutrition Query: {json.dumps(query_data, indent=2)}")
+        fast = use_fast_path(query)
+        source = "fast" if fast else "groq"
+
+        # --- 1. SHARED CACHE ---
+        # Identical profiles are answered from the cache shared by all workers
+        cache = get_shared_cache()
+        cache_key = SharedCache.make_key("plan", source, query_data)
+        cached_plan = cache.get(cache_key)
+        if cached_plan is not None:
+            logger.info("⚡ Serving meal plan from shared cache.")
+            etag = plan_etag(cached_plan)
+            if etag_matches(request, etag):
+                return not_modified(etag, await run_in_threadpool(stored_plan_id, cached_plan, query))
+            return JSONResponse(
+                content={"html_content": cached_plan, "plan_id": save_plan(cached_plan, query, "cache")},
+                headers={"ETag": etag},
+            )
+
+        # --- 2. GENERATE THE PLAN ---
+        final_output, source = await generate_plan(query, fast)
+        cache_key = SharedCache.make_key("plan", source, query_data)
+
+        # --- 3. POST-PROCESS AND CACHE ---
+        final_output = add_substitutions(final_output, query)
+        if wants_shopping_list(query):
+            final_output = add_shopping_list(final_output, query)
+        cache.set(cache_key, final_output, ttl=config.get("cache", {}).get("plan_ttl_seconds"))
+
         # Return the response in the format the frontend expects
-        return {"html_content": final_output}
+        return JSONResponse(
+            content={"html_content": final_output, "plan_id": save_plan(final_output, query, source)},
+            headers={"ETag": plan_etag(final_output)},
+        )
 
+    except ValueError as e:
+        logger.error(f"❌ Could not build a meal plan: {e}")
+        return JSONResponse(status_code=422, content={"error": str(e)})
     except Exception as e:
         logger.error(f"❌ An error occurred in the endpoint: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "An unexpected server error occurred."})
 
+# --- STREAMING ---
+def _event(event: str, **payload: Any) -> bytes:
+    """One newline-delimited JSON event."""
+    return (json.dumps({"event": event, **payload}, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+async def stream_agent_text(query: NutritionQueryRequest) -> AsyncIterator[tuple]:
+    """(message id, text) for every token the agent writes; tool-call rounds are skipped."""
+    nutrition_app = get_nutrition_app("groq")
+    messages = {"messages": [("user", build_user_prompt(query))]}
+    async for chunk, metadata in nutrition_app.astream(messages, stream_mode="messages"):
+        if (
+            isinstance(chunk, AIMessageChunk)
+            and metadata.get("langgraph_node") == "agent"
+            and not chunk.tool_call_chunks
+            and isinstance(chunk.content, str)
+        ):
+            yield chunk.id, chunk.content
+
+
+async def stream_fast_sections(query: NutritionQueryRequest) -> AsyncIterator[str]:
+    """Day sections from the local fast planner."""
+    plan = get_fast_planner().plan(query, days=query.plan_days or 1)
+    for warning in plan["warnings"]:
+        logger.warning(f"⚠️ {warning}")
+    for day in plan["days"]:
+        yield render_day(day, plan["targets"])
+
+
+@app.post("/query/stream")
+async def stream_nutritionist(query: NutritionQueryRequest, request: Request):
+    """
+    Same plan as /query, streamed as newline-delimited JSON so clients can render it
+    day by day: {"event": "day", "day", "html"} per day section, then optionally
+    {"event": "shopping_list", "html"}, then {"event": "done", "cached", "plan_id", "etag"}.
+    Failures are reported as {"event": "error", "error"}. Each day is post-processed
+    (substitutions, shopping list aggregation) as soon as its section closes.
+    A cached plan whose ETag matches If-None-Match is answered with a 304 instead.
+    """
+    query_data = profile_data(query)
+    logger.info(f"📥 Received streaming Nutrition Query: {json.dumps(query_data)}")
+    fast = use_fast_path(query)
+    cache = get_shared_cache()
+    cache_key = SharedCache.make_key("plan", "fast" if fast else "groq", query_data)
+    cached_plan = cache.get(cache_key)
+    if cached_plan is not None and etag_matches(request, plan_etag(cached_plan)):
+        logger.info("⚡ Cached meal plan is unchanged for the client.")
+        return not_modified(plan_etag(cached_plan), await run_in_threadpool(stored_plan_id, cached_plan, query))
+
+    async def events():
+        if cached_plan is not None:
+            logger.info("⚡ Streaming meal plan from shared cache.")
+            for number, section in enumerate(split_days(cached_plan) or [cached_plan], start=1):
+                yield _event("day", day=number, html=section)
+            shopping_list = SHOPPING_LIST_RE.search(cached_plan)
+            if shopping_list:
+                yield _event("shopping_list", html=shopping_list.group(0))
+            yield _event("done", cached=True, plan_id=save_plan(cached_plan, query, "cache"), etag=plan_etag(cached_plan))
+            return
+
+        aggregator = ShoppingListAggregator() if wants_shopping_list(query) else None
+        sections: List[str] = []
+
+        def finish_day(section: str) -> bytes:
+            section = add_substitutions(minify(section), query)
+            if aggregator is not None:
+                aggregator.add_day(section)
+            sections.append(section)
+            return _event("day", day=len(sections), html=section)
+
+        try:
+            plan_html, fast_fallback, source = None, False, "fast" if fast else "groq"
+            if not fast:
+                try:
+                    stream, message_id = DaySectionStream(), None
+                    async for chunk_id, text in stream_agent_text(query):
+                        if chunk_id != message_id and not sections:
+                            # Only the final answer matters; text from earlier tool rounds is dropped
+                            stream, message_id = DaySectionStream(), chunk_id
+                        for section in stream.feed(text):
+                            yield finish_day(section)
+                    if not sections:
+                        if not stream.full_text.strip():
+                            raise ValueError("AI agent did not produce a final response.")
+                        # The model ignored the day-section contract; send its answer as one block
+                        plan_html = add_substitutions(minify(stream.full_text), query)
+                        if aggregator is not None:
+                            aggregator.add_day(plan_html)
+                        yield _event("day", day=1, html=plan_html)
+                    else:
+                        # Cache and store the whole answer, including headings and tips outside the days
+                        plan_html = add_substitutions(minify(stream.full_text), query)
+                except Exception as e:
+                    if sections or plan_html is not None:
+                        raise
+                    logger.warning(f"⚠️ Agent failed ({e}); falling back to the local fast planner.")
+                    fast_fallback = True
+            if fast or fast_fallback:
+                source = "fast"
+                async for section in stream_fast_sections(query):
+                    yield finish_day(section)
+
+            shopping_list = ""
+            if aggregator is not None:
+                shopping_list = render_shopping_list(aggregator.summary(query.currency), days=aggregator.days)
+                yield _event("shopping_list", html=shopping_list)
+
+            final_output = (plan_html + shopping_list) if plan_html is not None else wrap_plan(sections + [shopping_list])
+            cache.set(
+                SharedCache.make_key("plan", source, query_data), final_output,
+                ttl=config.get("cache", {}).get("plan_ttl_seconds"),
+            )
+            yield _event("done", cached=False, plan_id=save_plan(final_output, query, source), etag=plan_etag(final_output))
+
+        except Exception as e:
+            logger.error(f"❌ An error occurred while streaming: {e}", exc_info=True)
+            message = str(e) if isinstance(e, ValueError) else "An unexpected server error occurred."
+            yield _event("error", error=message)
+
+    headers = {"ETag": plan_etag(cached_plan)} if cached_plan is not None else None
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=headers)
+
+# --- CONVERSATION THREADS ---
+class ThreadMessageRequest(BaseModel):
+    # Required on a thread's first message; sending it again replaces the stored profile
+    profile: Optional[NutritionQueryRequest] = None
+    message: Optional[str] = None
+
+
+@app.post("/threads")
+async def create_thread():
+    """Allocate an id for a new conversation."""
+    return {"thread_id": uuid.uuid4().hex}
+
+
+@app.post("/threads/{thread_id}/messages")
+async def post_thread_message(thread_id: str, body: ThreadMessageRequest):
+    """
+    One conversational turn. The first message carries the profile and gets a full
+    plan; follow-ups ("swap dinner for something vegetarian") only send the message.
+    State is checkpointed per thread, and older turns are compacted so the prompt
+    stays bounded however long the conversation gets.
+    """
+    try:
+        thread_app = get_thread_app("groq")
+        run_config = {"configurable": {"thread_id": thread_id}}
+        snapshot = await thread_app.aget_state(run_config)
+        started = bool(snapshot.values.get("messages"))
+        if not started and body.profile is None:
+            return JSONResponse(status_code=422, content={"error": "The first message of a thread must include a profile."})
+        if started and not body.message and body.profile is None:
+            return JSONResponse(status_code=422, content={"error": "Follow-up messages need a message."})
+
+        inputs: Dict[str, Any] = {}
+        if body.profile is not None:
+            inputs["profile"] = build_user_prompt(body.profile)
+            inputs["request"] = profile_data(body.profile)
+            # Kept apart from the request, which (like cache keys) leaves per-user fields out
+            inputs["user_id"] = body.profile.user_id
+        text = body.message or "Create my meal plan."
+        inputs["messages"] = [HumanMessage(content=text)]
+
+        logger.info(f"🧵 Thread {thread_id}: running turn.")
+        output_state = await thread_app.ainvoke(inputs, run_config)
+        final_output = output_state["messages"][-1].content if output_state.get("messages") else ""
+        if not final_output:
+            raise ValueError("AI agent did not produce a final response.")
+
+        query = body.profile or NutritionQueryRequest(**output_state["request"], user_id=output_state.get("user_id"))
+        final_output = add_substitutions(minify(final_output), query)
+        return {"thread_id": thread_id, "html_content": final_output, "plan_id": save_plan(final_output, query, "thread")}
+
+    except Exception as e:
+        logger.error(f"❌ An error occurred in thread {thread_id}: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": "An unexpected server error occurred."})
+
+
+@app.get("/threads/{thread_id}/messages")
+async def get_thread_messages(thread_id: str):
+    """The kept messages of a thread plus its running summary."""
+    snapshot = await get_thread_app("groq").aget_state({"configurable": {"thread_id": thread_id}})
+    if not snapshot.values.get("messages"):
+        raise HTTPException(status_code=404, detail="Thread not found.")
+    return {
+        "thread_id": thread_id,
+        "summary": snapshot.values.get("summary", ""),
+        "messages": [
+            {"role": message.type, "content": message.content}
+            for message in snapshot.values["messages"]
+        ],
+    }
+
+# --- DELTA RE-PLANNING ---
+def build_meal_prompt(query: NutritionQueryRequest, meal: dict) -> str:
+    """Prompt asking the agent for a single replacement meal card."""
+    target = meal["target"]
+    return f"""
+Replace one meal of an existing plan. Output ONLY one HTML <article> meal card with Tailwind CSS,
+following the required data attributes (data-meal="{meal['meal']}", calories and macros, ingredient rows,
+one empty <ul data-substitutions></ul>). No day sections, no summary, no Markdown.
+
+Meal being replaced: {meal['outline']}
+Why it must change: {meal['reason']}
+Target: about {target['calories']} kcal, {target['protein_g']} g protein, {target['carbs_g']} g carbs, {target['fats_g']} g fat
+
+User Profile:
+- Diet: {query.dietary_pattern}
+- Allergies: {', '.join(query.allergies) or 'None'}
+- Dislikes: {', '.join(query.dislikes) or 'None'}
+- Religious restrictions: {', '.join(query.religious_restrictions) or 'None'}
+- Budget: {query.budget}
+- Cooking Skill: {query.cooking_skill}
+"""
+
+
+async def regenerate_meal(query: NutritionQueryRequest, meal: dict, fast: bool) -> str:
+    """New card for one invalidated meal, from the agent or (fast mode / failure) the local planner."""
+    if not fast:
+        try:
+            answer = await run_agent(build_meal_prompt(query, meal))
+            card = MEAL_RE.search(minify(answer))
+            if card:
+                # Keep the slot's label even if the model renamed the meal
+                return re.sub(r'data-meal="[^"]*"', f'data-meal="{html.escape(meal["meal"])}"', card.group(0), count=1)
+            logger.warning(f"⚠️ Agent returned no meal card for {meal['meal']}; using the fast planner.")
+        except Exception as e:
+            logger.warning(f"⚠️ Agent failed for {meal['meal']} ({e}); using the fast planner.")
+    return render_meal(get_fast_planner().plan_meal(query, meal["meal"], meal["target"]))
+
+
+@app.post("/plans/{plan_id}/replan")
+async def replan(plan_id: str, query: NutritionQueryRequest):
+    """
+    Re-plan a stored plan for an edited profile, regenerating only what the edit
+    invalidates. Meals that now contain an excluded ingredient, or whose calories
+    drift from their share of a moved target, are regenerated in parallel and
+    spliced into the stored HTML, and the daily totals are recomputed; everything
+    else is kept. Structural edits (meals per day, plan length, medical context,
+    preferences like keto) fall back to a full plan. Soft preference edits (likes,
+    cuisines, budget, skill) leave existing meals valid and are reported in
+    "unapplied_fields".
+    """
+    try:
+        stored = await run_in_threadpool(get_plan_store().get_plan, plan_id)
+        if stored is None:
+            return JSONResponse(status_code=404, content={"error": "Plan not found."})
+
+        new_request = profile_data(query)
+        changed = changed_fields(stored["request"], new_request)
+        fast = use_fast_path(query)
+        previous_html = SHOPPING_LIST_RE.sub("", stored["html_content"])
+        plan = parse_plan(previous_html)
+        logger.info(f"♻️ Re-planning {plan_id}; changed fields: {changed}")
+
+        unapplied: List[str] = []
+        if needs_full_replan(stored["request"], new_request) or not plan["days"]:
+            final_output, source = await generate_plan(query, fast)
+            regenerated = [{"day": None, "meal": None, "reason": "full re-plan"}]
+        else:
+            tolerance = float(config.get("planner", {}).get("replan_calorie_tolerance", 0.10))
+            invalid = invalidated_meals(plan, stored["request"], new_request, tolerance)
+            meals_by_position = {(d["day"], i): m for d in plan["days"] for i, m in enumerate(d["meals"])}
+            for meal in invalid:
+                meal["outline"] = plan_outline({"days": [{"day": meal["day"], "meals": [meals_by_position[(meal["day"], meal["index"])]]}]})
+            cards = await asyncio.gather(*(regenerate_meal(query, meal, fast) for meal in invalid))
+            final_output = replace_meals(previous_html, {(m["day"], m["index"]): card for m, card in zip(invalid, cards)})
+            # Totals of days with new meals (or of every day, when the targets moved) are stale
+            targets_moved = any(f in TARGET_FIELDS for f in changed)
+            touched = None if targets_moved else {m["day"] for m in invalid}
+            if touched is None or touched:
+                final_output = refresh_day_totals(
+                    final_output, daily_targets(new_request), touched, tolerance=get_fast_planner().tolerance
+                )
+            source = "replan"
+            regenerated = [{"day": m["day"], "meal": m["meal"], "reason": m["reason"]} for m in invalid]
+            unapplied = [f for f in changed if f in PREFERENCE_FIELDS]
+
+        # Substitutions are recomputed for every meal, since exclusions may have changed
+        final_output = add_substitutions(final_output, query)
+        if wants_shopping_list(query):
+            final_output = add_shopping_list(final_output, query)
+        return {
+            "html_content": final_output,
+            "plan_id": save_plan(final_output, query, source),
+            "changed_fields": changed,
+            "regenerated": regenerated,
+            "unapplied_fields": unapplied,
+        }
+
+    except ValueError as e:
+        logger.error(f"❌ Could not re-plan: {e}")
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"❌ An error occurred while re-planning: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": "An unexpected server error occurred."})
+
+# --- PLAN HISTORY ---
+@app.get("/plans")
+async def list_plans(
+    user_id: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+    before: Optional[float] = None,
+    before_id: Optional[str] = None,
+    limit: int = 20,
+):
+    """
+    Newest-first metadata of stored plans. Page with before=<next_before> and
+    before_id=<next_before_id>; both are null on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    plans = await run_in_threadpool(get_plan_store().list_plans, user_id, fingerprint, before, limit, before_id)
+    last = plans[-1] if len(plans) == limit else None
+    return {
+        "plans": plans,
+        "next_before": last["created_at"] if last else None,
+        "next_before_id": last["plan_id"] if last else None,
+    }
+
+
+@app.get("/plans/{plan_id}")
+async def get_plan(plan_id: str, request: Request):
+    """
+    A stored plan with its HTML and the request that produced it. Stored plans never
+    change, so the response is cacheable and revalidates by ETag without loading
+    or decompressing the plan.
+    """
+    store = get_plan_store()
+    content_hash = await run_in_threadpool(store.plan_hash, plan_id)
+    if content_hash is None:
+        raise HTTPException(status_code=404, detail="Plan not found.")
+    etag = f'"{content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    plan = await run_in_threadpool(store.get_plan, plan_id)
+    return JSONResponse(content=plan, headers=headers)
+
 @app.get("/")
 async def root():
     """A simple health check endpoint to confirm the server is running."""
@@ -1,8 +1,89 @@
-import streamlit as st
-import requests
+import os
+import json
 import datetime
+from typing import Iterator, Optional
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = os.getenv("NUTRITION_API_URL", "http://localhost:8000")  # Backend endpoint
+# (connect, read) seconds; the read timeout is the longest wait between two streamed events
+REQUEST_TIMEOUT = (5, 180)
+# Identical submissions within this window are served from the local cache
+CACHE_TTL_SECONDS = 3600
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    One pooled HTTP session for the whole app, so every submission and rerun reuses
+    open keep-alive connections instead of reconnecting. Only failed connects are
+    retried; a plan request that reached the server is never sent twice.
+    """
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3, allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def stream_plan(payload: dict, etag: Optional[str] = None) -> Iterator[dict]:
+    """Events from /query/stream as they arrive; a 304 (plan unchanged) yields {"event": "not_modified"}."""
+    headers = {"If-None-Match": etag} if etag else {}
+    with get_session().post(
+        f"{BASE_URL}/query/stream", json=payload, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+    ) as response:
+        if response.status_code == 304:
+            yield {"event": "not_modified"}
+            return
+        if response.status_code != 200:
+            raise RuntimeError(f"Bot failed to respond: {response.text}")
+        # chunk_size=None hands over each event as soon as it is received
+        for line in response.iter_lines(chunk_size=None):
+            if line:
+                yield json.loads(line)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=32, show_spinner=False)
+def fetch_plan(form_key: str, _previous: Optional[dict] = None) -> dict:
+    """
+    Fetch and draw the plan for one set of form values (form_key is the JSON payload).
+
+    On a miss the plan is streamed and each section is drawn as it arrives. All
+    drawing goes into a container created here, so on a hit st.cache_data replays
+    the recorded sections exactly once without calling the backend. _previous is an
+    earlier result for the same form; it is revalidated by ETag instead of being
+    downloaded again. Arguments starting with an underscore are not part of the cache key.
+    """
+    plan_container = st.container()
+    plan = {"sections": [], "shopping_list": "", "plan_id": None, "etag": None, "cached": False,
+            "generated_at": datetime.datetime.now().strftime("%Y-%m-%d at %H:%M")}
+    for event in stream_plan(json.loads(form_key), _previous["etag"] if _previous else None):
+        if event["event"] == "not_modified":
+            for section in _previous["sections"] + ([_previous["shopping_list"]] if _previous["shopping_list"] else []):
+                plan_container.markdown(section, unsafe_allow_html=True)
+            return _previous
+        if event["event"] == "day":
+            plan["sections"].append(event["html"])
+            plan_container.markdown(event["html"], unsafe_allow_html=True)
+        elif event["event"] == "shopping_list":
+            plan["shopping_list"] = event["html"]
+            plan_container.markdown(event["html"], unsafe_allow_html=True)
+        elif event["event"] == "done":
+            plan.update(plan_id=event.get("plan_id"), etag=event.get("etag"), cached=event.get("cached", False))
+        elif event["event"] == "error":
+            raise RuntimeError(event["error"])
+    if not plan["sections"]:
+        raise RuntimeError("The backend returned an empty plan.")
+    return plan
+
+
+def split_list(text: str) -> list:
+    return [item.strip() for item in text.split(",") if item.strip()]
 
-BASE_URL = "http://localhost:8000"  # Backend endpoint
 
 st.set_page_config(
     page_title="🥗 Nutritionist Meal Suggestion App",
@@ -57,6 +138,7 @@ with st.form("nutrition_form"):
     with col3:
         meals_per_day = st.number_input("Meals per day", min_value=2, max_value=7, step=1, value=3)
         budget = st.selectbox("Food Budget", ["low", "medium", "high"], index=1)
+        plan_days = st.number_input("Plan length (days)", min_value=1, max_value=7, step=1, value=1)
 
     with col4:
         cooking_skill = st.selectbox(
@@ -77,62 +159,66 @@ with st.form("nutrition_form"):
     submit_button = st.form_submit_button("Generate Meal Plan 🥗")
 
 if submit_button:
-    try:
-        with st.spinner("AI Nutritionist is preparing your personalized plan..."):
-            payload = {
-                "age": age,
-                "gender": gender,
-                "height_cm": height_cm,
-                "weight_kg": weight_kg,
-                "activity_level": activity_level,
-                "sleep_hours": sleep_hours,
-                "medical_conditions": [c.strip() for c in medical_conditions.split(",") if c.strip()],
-                "medications": [m.strip() for m in medications.split(",") if m.strip()],
-                "allergies": [a.strip() for a in allergies.split(",") if a.strip()],
-                "dietary_pattern": dietary_pattern,
-                "dislikes": [d.strip() for d in dislikes.split(",") if d.strip()],
-                "likes": [l.strip() for l in likes.split(",") if l.strip()],
-                "religious_restrictions": [r.strip() for r in religious_restrictions.split(",") if r.strip()],
-                "meals_per_day": meals_per_day,
-                "budget": budget,
-                "cooking_skill": cooking_skill,
-                "output_wants": output_wants,
-                "goals": goals,
-            }
-
-            response = requests.post(f"{BASE_URL}/query", json=payload)
-
-        if response.status_code == 200:
-            answer = response.json().get("answer", "No answer returned.")
-            markdown_content = f"""
+    payload = {
+        "age": age,
+        "gender": gender,
+        "height_cm": height_cm,
+        "weight_kg": weight_kg,
+        "activity_level": activity_level,
+        "sleep_hours": sleep_hours,
+        "medical_conditions": split_list(medical_conditions),
+        "medications": split_list(medications),
+        "allergies": split_list(allergies),
+        "dietary_pattern": dietary_pattern,
+        "dislikes": split_list(dislikes),
+        "likes": split_list(likes),
+        "religious_restrictions": split_list(religious_restrictions),
+        "meals_per_day": meals_per_day,
+        "budget": budget,
+        "cooking_skill": cooking_skill,
+        "output_wants": output_wants,
+        "goals": goals,
+        "plan_days": plan_days,
+    }
+    # Remember the last submission so reruns (widget clicks, reloads) show it again
+    st.session_state["form_key"] = json.dumps(payload, sort_keys=True)
+
+form_key = st.session_state.get("form_key")
+if form_key:
+    profile = json.loads(form_key)
+    st.markdown(f"""
 # 🥗 Personalized Meal Plan
 
-**Generated:** {datetime.datetime.now().strftime('%Y-%m-%d at %H:%M')}  
-**Created by:** AI Nutritionist  
-
-**User Profile**  
-- Age: {age}  
-- Gender: {gender}  
-- Height: {height_cm} cm  
-- Weight: {weight_kg} kg  
-- Activity Level: {activity_level}  
-- Sleep Hours: {sleep_hours}  
-- Goals: {", ".join(goals)}  
-- Budget: {budget}  
-- Cooking Skill: {cooking_skill}  
-- Dietary Pattern: {dietary_pattern}  
-
----
+**Created by:** AI Nutritionist
 
-{answer}
+**User Profile**
+- Age: {profile["age"]}
+- Gender: {profile["gender"]}
+- Height: {profile["height_cm"]} cm
+- Weight: {profile["weight_kg"]} kg
+- Activity Level: {profile["activity_level"]}
+- Sleep Hours: {profile["sleep_hours"]}
+- Goals: {", ".join(profile["goals"])}
+- Budget: {profile["budget"]}
+- Cooking Skill: {profile["cooking_skill"]}
+- Dietary Pattern: {profile["dietary_pattern"]}
 
 ---
+""")
 
-*This meal plan was generated by AI. Please consult a licensed healthcare professional before making medical or dietary changes.*
-"""
-            st.markdown(markdown_content)
-        else:
-            st.error("❌ Bot failed to respond: " + response.text)
-
+    known_plans = st.session_state.setdefault("plans", {})
+    try:
+        with st.spinner("AI Nutritionist is preparing your personalized plan..."):
+            # Draws the plan itself: streamed on a miss, replayed from the cache on a hit
+            plan = fetch_plan(form_key, _previous=known_plans.get(form_key))
     except Exception as e:
         st.error(f"The response failed due to: {e}")
+    else:
+        known_plans[form_key] = plan
+        st.markdown(f"""
+---
+
+**Generated:** {plan["generated_at"]}{"  (plan id: " + plan["plan_id"] + ")" if plan["plan_id"] else ""}
+
+*This meal plan was generated by AI. Please consult a licensed healthcare professional before making medical or dietary changes.*
+""")
@@ -1,20 +1,45 @@
 import os
 import requests
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.tools import tool
 from dotenv import load_dotenv
+from utils.shared_cache import get_shared_cache
 
 load_dotenv()  # Loads variables from .env
 
+NUTRITIONIX_URL = "https://trackapi.nutritionix.com/v2/natural/nutrients"
+
+# Nutritionix parses multi-item queries, but very long ones get truncated or
+# rejected, so batch lookups are split into chunks bounded by both limits.
+MAX_ITEMS_PER_REQUEST = 20
+MAX_QUERY_CHARS = 500
+
 
 class CalorieCalculatorTool:
     def __init__(self):
         self.app_id = os.getenv("NUTRITIONIX_APP_ID")
         self.api_key = os.getenv("NUTRITIONIX_API_KEY")
+        # One pooled session so chunked batch requests reuse the TLS connection
+        self.session = requests.Session()
 
         # If credentials are missing, do not register the tool to avoid crashing the graph
-        self.tool_list = [self.get_nutrition_info] if self.app_id and self.api_key else []
+        self.tool_list = self._setup_tools() if self.app_id and self.api_key else []
+
+    def _setup_tools(self) -> List:
+        """Expose the single and batch Nutritionix lookups as tools the LLM can call."""
+        @tool
+        def get_nutrition_info(food_query: str) -> dict:
+            """Get calories, protein, carbs and fats (Nutritionix) for a food description such as "2 eggs and toast"."""
+            return self.get_nutrition_info(food_query)
+
+        @tool
+        def get_nutrition_info_batch(food_items: List[str]) -> dict:
+            """Get per-item and total calories/macros for a whole meal or day in one call, e.g. ["2 eggs", "1 cup rice", "200g chicken"]. Prefer this over repeated single lookups."""
+            return self.get_nutrition_info_batch(food_items)
+
+        return [get_nutrition_info, get_nutrition_info_batch]
 
-    @tool
     def get_nutrition_info(self, food_query: str) -> dict:
         """
         Get nutrition info for a food item using Nutritionix API.
@@ -26,7 +51,83 @@ class CalorieCalculatorTool:
         if not self.app_id or not self.api_key:
             return {"error": "Nutritionix credentials are not configured."}
 
-        url = "https://trackapi.nutritionix.com/v2/natural/nutrients"
+        # Identical queries from any worker are served from the shared cache
+        cache = get_shared_cache()
+        key = cache.make_key("nutritionix", food_query.strip().lower())
+        return cache.get_or_set(key, lambda: self._request_nutrition(food_query))
+
+    def get_nutrition_info_batch(self, food_items: List[str]) -> dict:
+        """
+        Get nutrition info for a list of food items with as few Nutritionix calls as possible.
+        Args:
+            food_items (List[str]): Items with quantities (e.g., ['2 eggs', '1 cup rice'])
+        Returns:
+            dict: Per-item calories/macros under "items" and their sum under "totals".
+                  Chunks that fail are listed under "errors" without dropping the rest.
+        """
+        if not self.app_id or not self.api_key:
+            return {"error": "Nutritionix credentials are not configured."}
+
+        food_items = [item.strip() for item in food_items if item and item.strip()]
+        if not food_items:
+            return {"error": "No food items given"}
+
+        chunks = self._chunk_items(food_items)
+        cache = get_shared_cache()
+
+        def lookup(chunk: List[str]) -> dict:
+            query = ", ".join(chunk)
+            key = cache.make_key("nutritionix-batch", query.lower())
+            return cache.get_or_set(key, lambda: self._request_batch(query))
+
+        # Chunks are independent, so long lists cost one round-trip of latency
+        with ThreadPoolExecutor(max_workers=min(4, len(chunks))) as executor:
+            chunk_results = list(executor.map(lookup, chunks))
+
+        items, errors = [], []
+        for chunk, result in zip(chunks, chunk_results):
+            if "error" in result:
+                errors.append({"query": ", ".join(chunk), "error": result["error"]})
+            else:
+                items.extend(result["items"])
+
+        totals = {
+            field: round(sum(item[field] for item in items), 1)
+            for field in ("calories", "protein_g", "carbs_g", "fats_g")
+        }
+        response = {"items": items, "totals": totals}
+        if errors:
+            response["errors"] = errors
+        return response
+
+    @staticmethod
+    def _chunk_items(food_items: List[str]) -> List[List[str]]:
+        """Split items into chunks within MAX_ITEMS_PER_REQUEST and MAX_QUERY_CHARS."""
+        chunks, current, length = [], [], 0
+        for item in food_items:
+            added = len(item) + (2 if current else 0)
+            if current and (len(current) >= MAX_ITEMS_PER_REQUEST or length + added > MAX_QUERY_CHARS):
+                chunks.append(current)
+                current, length = [], 0
+                added = len(item)
+            current.append(item)
+            length += added
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _macros(food: dict) -> dict:
+        """Pick the fields we report out of a Nutritionix food record."""
+        return {
+            "calories": food.get("nf_calories") or 0,
+            "protein_g": food.get("nf_protein") or 0,
+            "carbs_g": food.get("nf_total_carbohydrate") or 0,
+            "fats_g": food.get("nf_total_fat") or 0,
+        }
+
+    def _post_query(self, food_query: str) -> dict:
+        """POST a natural-language query and return the raw JSON (or an error dict)."""
         headers = {
             "x-app-id": self.app_id,
             "x-app-key": self.api_key,
@@ -35,7 +136,7 @@ class CalorieCalculatorTool:
         data = {"query": food_query}
 
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=20)
+            response = self.session.post(NUTRITIONIX_URL, headers=headers, json=data, timeout=20)
             response.raise_for_status()
         except requests.RequestException as e:
             return {"error": f"API request failed: {e}"}
@@ -43,10 +144,28 @@ class CalorieCalculatorTool:
         result = response.json()
         if "foods" not in result or not result["foods"]:
             return {"error": "No food data found"}
-        food = result["foods"][0]
-        return {
-            "calories": food.get("nf_calories", 0),
-            "protein_g": food.get("nf_protein", 0),
-            "carbs_g": food.get("nf_total_carbohydrate", 0),
-            "fats_g": food.get("nf_total_fat", 0),
-        }
\ No newline at end of file
+        return result
+
+    def _request_nutrition(self, food_query: str) -> dict:
+        """Call the Nutritionix natural-language endpoint for a single query."""
+        result = self._post_query(food_query)
+        if "error" in result:
+            return result
+        return self._macros(result["foods"][0])
+
+    def _request_batch(self, food_query: str) -> dict:
+        """Call the Nutritionix endpoint once and keep every food it parsed."""
+        result = self._post_query(food_query)
+        if "error" in result:
+            return result
+        items = []
+        for food in result["foods"]:
+            item = {
+                "food": food.get("food_name"),
+                "quantity": food.get("serving_qty"),
+                "unit": food.get("serving_unit"),
+                "grams": food.get("serving_weight_grams"),
+            }
+            item.update(self._macros(food))
+            items.append(item)
+        return {"items": items}
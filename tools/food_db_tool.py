@@ -1,7 +1,9 @@
+from typing import List
 from langchain_core.tools import tool
 import requests
 import os
 from dotenv import load_dotenv
+from utils.shared_cache import get_shared_cache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,9 +13,17 @@ class FoodDBTool:
     def __init__(self):
         self.api_key = os.getenv("USDA_API_KEY")
         # Degrade gracefully if missing
-        self.tool_list = [self.lookup_food] if self.api_key else []
+        self.tool_list = self._setup_tools() if self.api_key else []
+
+    def _setup_tools(self) -> List:
+        """Expose lookup_food as a tool the LLM can call (plain function, no self argument)."""
+        @tool
+        def lookup_food(food_name: str) -> dict:
+            """Look up calories, protein, carbs and fat for a single food (e.g. 'banana') in USDA FoodData Central."""
+            return self.lookup_food(food_name)
+
+        return [lookup_food]
 
-    @tool
     def lookup_food(self, food_name: str) -> dict:
         """
         Look up nutritional information for a food item using USDA FoodData Central API.
@@ -25,6 +35,13 @@ class FoodDBTool:
         if not self.api_key:
             return {"error": "USDA API key is not configured."}
 
+        # Identical lookups from any worker are served from the shared cache
+        cache = get_shared_cache()
+        key = cache.make_key("usda", food_name.strip().lower())
+        return cache.get_or_set(key, lambda: self._request_food(food_name))
+
+    def _request_food(self, food_name: str) -> dict:
+        """Call the USDA FoodData Central search endpoint for a single food."""
         base_url = "https://api.nal.usda.gov/fdc/v1/foods/search"
         params = {
             "query": food_name,
@@ -1,3 +1,4 @@
+from typing import List
 from langchain_core.tools import tool
 import os
 from dotenv import load_dotenv
@@ -7,7 +8,7 @@ USDA_API_KEY = os.getenv("USDA_API_KEY")  # optional for later API expansion
 
 class NutritionConverterTool:
     def __init__(self):
-        self.tool_list = [self.convert_units]
+        self.tool_list = self._setup_tools()
 
         # Basic portion conversion data (grams + calories per unit)
         self.conversions = {
@@ -29,7 +30,15 @@ class NutritionConverterTool:
             # add more items as needed
         }
 
-    @tool
+    def _setup_tools(self) -> List:
+        """Expose convert_units as a tool the LLM can call (plain function, no self argument)."""
+        @tool
+        def convert_units(item: str, quantity: float, unit: str) -> dict:
+            """Convert a portion (e.g. item='rice', quantity=1, unit='cup') to grams and estimated calories."""
+            return self.convert_units(item, quantity, unit)
+
+        return [convert_units]
+
     def convert_units(self, item: str, quantity: float, unit: str) -> dict:
         """
         Convert portion sizes to standard grams + calories.
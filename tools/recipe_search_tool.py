@@ -1,7 +1,11 @@
+from typing import List, Optional
 from langchain_core.tools import tool
 import requests
 import os
 from dotenv import load_dotenv
+from utils.shared_cache import get_shared_cache
+from utils.recipe_store import get_recipe_store
+from utils.food_tags import DIETARY_PATTERNS, canonical_allergens, detect_allergens, infer_diets, mentions
 
 # Load environment variables
 load_dotenv()
@@ -11,29 +15,106 @@ class RecipeSearchTool:
     def __init__(self):
         self.app_id = os.getenv("EDAMAM_APP_ID")
         self.app_key = os.getenv("EDAMAM_APP_KEY")
-        # Only register the tool when credentials exist, otherwise degrade gracefully
-        self.tool_list = [self.search_recipe] if self.app_id and self.app_key else []
+        # The local corpus works offline, so the tool is always registered;
+        # Edamam is only used as a fallback when its credentials exist.
+        self.recipe_store = get_recipe_store()
+        self.tool_list = self._setup_tools()
 
-    @tool
-    def search_recipe(self, query: str, dietary_pref: str = "any") -> dict:
+    def _setup_tools(self) -> List:
+        """Expose search_recipe as a tool the LLM can call (plain function, no self argument)."""
+        @tool
+        def search_recipe(
+            query: str,
+            dietary_pref: str = "any",
+            allergies: Optional[List[str]] = None,
+            max_cost: str = "",
+            max_skill: str = "",
+            meal_type: str = "",
+        ) -> dict:
+            """Search the recipe library, e.g. query='high protein breakfast with oats'. dietary_pref: omnivore/pescatarian/eggetarian/vegetarian/vegan; allergies: e.g. ['peanuts', 'lactose']; max_cost: low/medium/high; max_skill: beginner/intermediate/advanced; meal_type: breakfast/lunch/dinner/snack."""
+            return self.search_recipe(query, dietary_pref, allergies, max_cost, max_skill, meal_type)
+
+        return [search_recipe]
+
+    def search_recipe(
+        self,
+        query: str,
+        dietary_pref: str = "any",
+        allergies: Optional[List[str]] = None,
+        max_cost: str = "",
+        max_skill: str = "",
+        meal_type: str = "",
+        k: int = 3,
+    ) -> dict:
         """
-        Search for recipes using Edamam Recipe Search API.
+        Search the local recipe corpus, falling back to Edamam when nothing matches.
         Args:
             query (str): e.g., "high protein breakfast with oats"
-            dietary_pref (str): 'vegetarian', 'vegan', 'non-veg' (Edamam supports 'vegetarian'/'vegan')
+            dietary_pref (str): 'omnivore', 'pescatarian', 'eggetarian', 'vegetarian', 'vegan' or 'any'
+            allergies (List[str]): Free-text allergies to exclude (e.g., ['peanuts', 'lactose'])
+            max_cost (str): Highest cost tier allowed ('low', 'medium', 'high')
+            max_skill (str): Highest cooking skill allowed ('beginner', 'intermediate', 'advanced')
+            meal_type (str): 'breakfast', 'lunch', 'dinner' or 'snack'
         Returns:
-            dict: Recipe suggestions with title, ingredients, instructions, and dietary info.
+            dict: Recipe suggestions with title, ingredients, instructions, per-serving macros and tags.
         """
+        results = self.recipe_store.search(
+            query,
+            k=k,
+            dietary_pattern=None if dietary_pref == "any" else dietary_pref,
+            allergies=allergies,
+            max_cost=max_cost or None,
+            max_skill=max_skill or None,
+            meal_type=meal_type or None,
+        )
+        if results:
+            return {"recipes": [self._format_recipe(recipe) for recipe in results]}
+
         if not self.app_id or not self.app_key:
-            return {"error": "Edamam credentials are not configured."}
+            return {"error": "No recipes found"}
+
+        # Identical searches from any worker are served from the shared cache; the
+        # key covers every restriction the hits are filtered by
+        allergens, leftovers = canonical_allergens(allergies or [])
+        cache = get_shared_cache()
+        key = cache.make_key(
+            "edamam", query.strip().lower(), (dietary_pref or "any").lower(), sorted(allergens), sorted(leftovers)
+        )
+        return cache.get_or_set(key, lambda: self._request_recipes(query, dietary_pref, allergies, k))
 
+    @staticmethod
+    def _format_recipe(recipe: dict) -> dict:
+        """Shape a corpus record like the Edamam results the prompt already expects."""
+        ingredient_lines = []
+        for ingredient in recipe["ingredients"]:
+            amount = f"{ingredient['quantity']:g} {ingredient['unit']} " if ingredient.get("quantity") else ""
+            ingredient_lines.append(f"{amount}{ingredient['name']}")
+        return {
+            "recipe_title": recipe["title"],
+            "ingredients": ingredient_lines,
+            "instructions": recipe["instructions"],
+            "servings": recipe["servings"],
+            "per_serving": recipe["per_serving"],
+            "allergens": recipe["allergens"],
+            "diets": recipe["diets"],
+            "cuisines": recipe["cuisines"],
+            "cost": recipe["cost"],
+            "skill": recipe["skill"],
+        }
+
+    def _request_recipes(self, query: str, dietary_pref: str, allergies: Optional[List[str]] = None, k: int = 3) -> dict:
+        """
+        Call the Edamam recipe search endpoint for a single query. Edamam cannot filter
+        by our allergy or diet rules, so extra hits are requested and checked against
+        them with the same keyword rules as the local corpus.
+        """
         base_url = "https://api.edamam.com/search"
         params = {
             "q": query,
             "app_id": self.app_id,
             "app_key": self.app_key,
             "from": 0,
-            "to": 3,  # top 3 recipes
+            "to": 20,  # filtered down to the top k below
         }
 
         # Apply dietary filter if supported by Edamam via 'health' parameter
@@ -50,15 +131,27 @@ class RecipeSearchTool:
         if not data.get("hits"):
             return {"error": "No recipes found"}
 
-        # Extract top 3 recipes
+        allergens, leftovers = canonical_allergens(allergies or [])
+        diet = (dietary_pref or "").lower()
         recipes = []
         for hit in data["hits"]:
             recipe = hit["recipe"]
+            lines = recipe.get("ingredientLines") or []
+            if (
+                allergens & set(detect_allergens(lines))
+                or any(mentions(lines, term) for term in leftovers)
+                or (diet in DIETARY_PATTERNS and diet not in infer_diets(lines))
+            ):
+                continue
             recipes.append({
                 "recipe_title": recipe.get("label"),
                 "ingredients": recipe.get("ingredientLines"),
                 "instructions_url": recipe.get("url"),  # Edamam provides URL, not full instructions
                 "dietary_pref": dietary_pref
             })
+            if len(recipes) == k:
+                break
 
+        if not recipes:
+            return {"error": "No recipes found that fit the allergies and diet"}
         return {"recipes": recipes}
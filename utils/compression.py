@@ -0,0 +1,150 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best content coding the client accepts: "br" (when brotli is installed), "gzip" or None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder that can flush after every chunk."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 16 + 15: zlib stream with a gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it right away."""
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with brotli or gzip, negotiated from
+    Accept-Encoding.
+
+    Complete bodies below `minimum_size` are sent as is. Streamed bodies (e.g. the
+    NDJSON plan stream) are compressed chunk by chunk with a flush after each one,
+    so every event still reaches the client as soon as it is produced, unlike a
+    buffering gzip stream. ETags of compressed responses are made weak, since the
+    bytes on the wire differ from the identity representation. A 304 sent to a
+    client that negotiated compression carries the same weak validator its 200
+    would have.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                if start["status"] == 304:
+                    _weaken_etag(headers)
+                    headers.add_vary_header("Accept-Encoding")
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                if (
+                    "content-encoding" in headers
+                    or start["status"] == 204
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                _weaken_etag(headers)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            data = encoder.compress(body) if body else b""
+            if not more_body:
+                data += encoder.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
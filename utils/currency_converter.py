@@ -1,16 +1,109 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
 import requests
 
+from utils.config_loader import load_config
+from utils.shared_cache import SharedCache, get_shared_cache
+
+
 class CurrencyConverter:
-    def __init__(self, api_key: str):
+    """
+    Currency conversion from a locally held exchange-rate table.
+
+    The whole table for one base currency is fetched once and then refreshed by a
+    daemon thread (failed refreshes are retried with backoff), so convert() is a
+    dictionary lookup that never waits on the network. Tables are also stored in
+    the shared cache, so only one worker per refresh period actually calls the
+    rate API. Any pair is converted through the base currency.
+    """
+
+    # First retry delay after a failed refresh; doubled per failure up to refresh_seconds
+    RETRY_SECONDS = 30
+
+    def __init__(self, api_key: Optional[str], base_currency: str = "USD", refresh_seconds: int = 21600):
         self.base_url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/"
-    
-    def convert(self, amount:float, from_currency:str, to_currency:str):
-        """Convert the amount from one currency to another"""
-        url = f"{self.base_url}/{from_currency}"
-        response = requests.get(url)
+        self.api_key = api_key
+        self.base_currency = base_currency.upper()
+        self.refresh_seconds = refresh_seconds
+        self.rates: Dict[str, float] = {self.base_currency: 1.0}
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    def _fetch_rates(self) -> Dict[str, float]:
+        """Download the full rate table for the base currency."""
+        response = requests.get(f"{self.base_url}{self.base_currency}", timeout=10)
         if response.status_code != 200:
             raise Exception("API call failed:", response.json())
-        rates = response.json()["conversion_rates"]
-        if to_currency not in rates:
-            raise ValueError(f"{to_currency} not found in exchange rates.")
-        return amount * rates[to_currency]
\ No newline at end of file
+        return response.json()["conversion_rates"]
+
+    def refresh(self) -> bool:
+        """
+        Load a fresh table from the shared cache, or from the API when the cached
+        one has expired. Returns False (keeping the old table) on failure.
+        """
+        if not self.api_key:
+            return False
+        cache = get_shared_cache()
+        key = SharedCache.make_key("fx-rates", self.base_currency)
+        try:
+            rates = cache.get_or_set(key, self._fetch_rates, ttl=self.refresh_seconds)
+        except Exception as e:
+            print(f"Exchange rate refresh failed: {e}")
+            return False
+        with self._lock:
+            self.rates = {code.upper(): float(rate) for code, rate in rates.items()}
+            self.updated_at = time.time()
+        return True
+
+    def _refresh_loop(self) -> None:
+        failures = 0 if self.updated_at else 1
+        while True:
+            if failures:
+                time.sleep(min(self.RETRY_SECONDS * 2 ** (failures - 1), self.refresh_seconds))
+            else:
+                time.sleep(self.refresh_seconds)
+            failures = 0 if self.refresh() else min(failures + 1, 20)
+
+    def start_background_refresh(self) -> None:
+        """Load the table now and keep it fresh from a daemon thread (once per process)."""
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self.refresh()
+        if self.api_key:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="fx-refresh", daemon=True)
+            self._refresher.start()
+
+    def convert(self, amount: float, from_currency: str, to_currency: str) -> float:
+        """
+        Convert the amount from one currency to another with the table held in memory.
+        Raises ValueError for a currency the table does not (yet) have.
+        """
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        if from_currency == to_currency:
+            return amount
+        with self._lock:
+            rates = self.rates
+        for code in (from_currency, to_currency):
+            if code not in rates:
+                raise ValueError(f"{code} not found in exchange rates.")
+        return amount / rates[from_currency] * rates[to_currency]
+
+
+_currency_converter: Optional[CurrencyConverter] = None
+
+
+def get_currency_converter() -> CurrencyConverter:
+    """Return the process-wide CurrencyConverter configured from config.yaml."""
+    global _currency_converter
+    if _currency_converter is None:
+        currency_config = load_config().get("currency", {})
+        _currency_converter = CurrencyConverter(
+            api_key=os.getenv("EXCHANGE_RATE_API_KEY"),
+            base_currency=currency_config.get("base", "USD"),
+            refresh_seconds=int(currency_config.get("refresh_seconds", 21600)),
+        )
+    return _currency_converter
@@ -0,0 +1,206 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Ordered tiers: a recipe fits a user when its tier index is <= the user's tier index
+COST_TIERS = ["low", "medium", "high"]
+SKILL_LEVELS = ["beginner", "intermediate", "advanced"]
+
+# Dietary patterns offered by the frontend, from least to most restrictive
+DIETARY_PATTERNS = ["omnivore", "pescatarian", "eggetarian", "vegetarian", "vegan"]
+
+ALLERGEN_KEYWORDS: Dict[str, List[str]] = {
+    "dairy": ["milk", "cheese", "butter", "yogurt", "yoghurt", "cream", "paneer", "ghee", "whey", "curd", "casein", "feta", "mozzarella", "parmesan", "ricotta"],
+    "egg": ["egg", "mayonnaise", "mayo"],
+    "gluten": ["wheat", "flour", "bread", "pasta", "semolina", "barley", "rye", "couscous", "tortilla", "oats", "noodle", "seitan", "soy sauce", "bulgur", "spaghetti"],
+    "peanut": ["peanut"],
+    "tree_nut": ["almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "macadamia", "brazil nut"],
+    "soy": ["soy", "soya", "tofu", "tempeh", "edamame", "miso"],
+    "fish": ["fish", "salmon", "tuna", "cod", "anchovy", "sardine", "tilapia", "halibut", "mackerel", "trout"],
+    "shellfish": ["shrimp", "prawn", "crab", "lobster", "mussel", "clam", "oyster", "scallop"],
+    "sesame": ["sesame", "tahini", "hummus"],
+}
+
+# Phrases that contain a dairy keyword but are not dairy
+NON_DAIRY_PHRASES = [
+    "almond milk", "soy milk", "oat milk", "rice milk", "coconut milk", "coconut cream",
+    "peanut butter", "almond butter", "cashew butter", "nut butter", "cocoa butter",
+]
+
+MEAT_KEYWORDS = [
+    "chicken", "beef", "pork", "lamb", "turkey", "bacon", "ham", "sausage", "mutton", "veal",
+    "duck", "goat", "prosciutto", "salami", "pepperoni", "gelatin", "steak", "chorizo",
+]
+
+# Free-text allergy answers mapped onto the canonical allergen keys above
+ALLERGEN_SYNONYMS: Dict[str, List[str]] = {
+    "dairy": ["dairy"], "lactose": ["dairy"], "milk": ["dairy"], "casein": ["dairy"],
+    "egg": ["egg"], "eggs": ["egg"],
+    "gluten": ["gluten"], "wheat": ["gluten"], "celiac": ["gluten"], "coeliac": ["gluten"],
+    "peanut": ["peanut"], "peanuts": ["peanut"],
+    "nut": ["peanut", "tree_nut"], "nuts": ["peanut", "tree_nut"],
+    "tree nut": ["tree_nut"], "tree nuts": ["tree_nut"], "tree_nut": ["tree_nut"],
+    "soy": ["soy"], "soya": ["soy"],
+    "fish": ["fish"], "shellfish": ["shellfish"], "seafood": ["fish", "shellfish"],
+    "sesame": ["sesame"],
+}
+
+_STOPWORDS = {"a", "an", "and", "the", "with", "of", "in", "on", "for", "to", "or", "style"}
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def normalize_word(word: str) -> str:
+    """Light plural stripping so 'eggs'/'egg' and 'tomatoes'/'tomato' match."""
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-letters, drop stopwords and strip plurals."""
+    return [normalize_word(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def _contains(tokens: List[str], keyword: str) -> bool:
+    """True when the (possibly multi-word) keyword occurs as whole words in tokens."""
+    key_tokens = tokenize(keyword)
+    if len(key_tokens) == 1:
+        return key_tokens[0] in tokens
+    joined = " " + " ".join(tokens) + " "
+    return " " + " ".join(key_tokens) + " " in joined
+
+
+def mentions(names: Iterable[str], term: str) -> bool:
+    """True when the (possibly multi-word) term occurs as whole words in any of the names."""
+    return any(_contains(tokenize(name), term) for name in names)
+
+
+def detect_allergens(ingredient_names: Iterable[str]) -> List[str]:
+    """Return the sorted canonical allergens present in a list of ingredient names."""
+    found: Set[str] = set()
+    for name in ingredient_names:
+        lowered = name.lower()
+        for phrase in NON_DAIRY_PHRASES:
+            lowered = lowered.replace(phrase, " ")
+        tokens = tokenize(lowered)
+        raw_tokens = tokenize(name)
+        for allergen, keywords in ALLERGEN_KEYWORDS.items():
+            source = tokens if allergen == "dairy" else raw_tokens
+            if any(_contains(source, keyword) for keyword in keywords):
+                found.add(allergen)
+    return sorted(found)
+
+
+def infer_diets(ingredient_names: Iterable[str]) -> List[str]:
+    """Return every dietary pattern a recipe with these ingredients satisfies."""
+    names = list(ingredient_names)
+    allergens = set(detect_allergens(names))
+    tokens = [tokenize(name) for name in names]
+    has_meat = any(_contains(t, k) for t in tokens for k in MEAT_KEYWORDS)
+    has_fish = bool(allergens & {"fish", "shellfish"})
+    has_egg = "egg" in allergens
+    has_dairy = "dairy" in allergens
+    has_honey = any(_contains(t, "honey") for t in tokens)
+
+    diets = ["omnivore"]
+    if not has_meat:
+        diets.append("pescatarian")
+        if not has_fish:
+            diets.append("eggetarian")
+            if not has_egg:
+                diets.append("vegetarian")
+                if not has_dairy and not has_honey:
+                    diets.append("vegan")
+    return diets
+
+
+def canonical_allergens(terms: Iterable[str]) -> Tuple[Set[str], List[str]]:
+    """
+    Map free-text allergy answers to canonical allergen keys.
+    Answers that are not synonyms but name an allergen food ("sesame seeds",
+    "shrimp") map through the allergen keywords. Returns (allergens, leftover_terms);
+    leftovers are unknown terms, to be excluded as whole phrases (see mentions).
+    """
+    allergens: Set[str] = set()
+    leftovers: List[str] = []
+    for term in terms:
+        key = term.strip().lower()
+        if not key:
+            continue
+        if key in ALLERGEN_SYNONYMS:
+            allergens.update(ALLERGEN_SYNONYMS[key])
+        elif normalize_word(key) in ALLERGEN_SYNONYMS:
+            allergens.update(ALLERGEN_SYNONYMS[normalize_word(key)])
+        elif detect_allergens([key]):
+            allergens.update(detect_allergens([key]))
+        else:
+            leftovers.append(key)
+    return allergens, leftovers
+
+
+# Ingredients excluded by common religious dietary rules
+RELIGIOUS_EXCLUSIONS: Dict[str, List[str]] = {
+    "halal": ["pork", "bacon", "ham", "prosciutto", "salami", "pepperoni", "chorizo", "gelatin", "wine"],
+    "kosher": ["pork", "bacon", "ham", "prosciutto", "shrimp", "prawn", "crab", "lobster", "mussel", "clam", "oyster", "scallop"],
+    "hindu": ["beef", "veal", "steak"],
+    "jain": ["onion", "garlic", "potato", "carrot", "beef", "chicken", "pork", "lamb", "fish", "egg"],
+}
+
+
+def religious_exclusions(terms: Iterable[str]) -> List[str]:
+    """Ingredient terms to exclude for the given religious restrictions; unknown terms pass through."""
+    excluded: List[str] = []
+    for term in terms:
+        key = term.strip().lower()
+        if key:
+            excluded.extend(RELIGIOUS_EXCLUSIONS.get(key, [key]))
+    return excluded
+
+
+# Dietary preferences the local planners can enforce, as (dietary pattern, allergen keys, cuisine)
+DIETARY_PREFERENCE_RULES: Dict[str, Tuple[Optional[str], List[str], Optional[str]]] = {
+    "vegetarian": ("vegetarian", [], None),
+    "vegan": ("vegan", [], None),
+    "pescatarian": ("pescatarian", [], None),
+    "eggetarian": ("eggetarian", [], None),
+    "gluten-free": (None, ["gluten"], None),
+    "dairy-free": (None, ["dairy"], None),
+    "lactose-free": (None, ["dairy"], None),
+    "nut-free": (None, ["peanut", "tree_nut"], None),
+    "egg-free": (None, ["egg"], None),
+    "soy-free": (None, ["soy"], None),
+    "mediterranean": (None, [], "mediterranean"),
+}
+# Answers that add no restriction at all
+NEUTRAL_PREFERENCES = {"no-restrictions", "none", "omnivore", "any"}
+
+
+def strictest_pattern(patterns: Iterable[Optional[str]]) -> Optional[str]:
+    """Most restrictive of the known dietary patterns given (unknown ones are ignored)."""
+    known = [p.lower() for p in patterns if p and p.lower() in DIETARY_PATTERNS]
+    return max(known, key=DIETARY_PATTERNS.index) if known else None
+
+
+def dietary_preference_rules(preferences: Iterable[str]) -> dict:
+    """
+    Translate free-text dietary preferences ("Gluten-free", "Vegan", "Keto") into
+    filters: {"dietary_pattern", "allergies", "cuisines", "unsupported"}. Preferences
+    with no local rule (keto, paleo, low-carb, ...) are returned as unsupported.
+    """
+    rules = {"dietary_pattern": None, "allergies": [], "cuisines": [], "unsupported": []}
+    for preference in preferences:
+        key = re.sub(r"[\s_]+", "-", preference.strip().lower())
+        if not key or key in NEUTRAL_PREFERENCES:
+            continue
+        if key not in DIETARY_PREFERENCE_RULES:
+            rules["unsupported"].append(preference)
+            continue
+        pattern, allergens, cuisine = DIETARY_PREFERENCE_RULES[key]
+        rules["dietary_pattern"] = strictest_pattern([rules["dietary_pattern"], pattern])
+        rules["allergies"].extend(allergens)
+        if cuisine:
+            rules["cuisines"].append(cuisine)
+    return rules
@@ -0,0 +1,246 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.config_loader import load_config
+from utils.food_tags import dietary_preference_rules, religious_exclusions, strictest_pattern, tokenize
+from utils.nutrition_calculator import NutritionCalculator
+from utils.recipe_store import RecipeStore, get_recipe_store
+
+# (label, recipe meal type, share of daily calories) by number of meals per day
+MEAL_SLOTS = {
+    1: [("Main Meal", "dinner", 1.00)],
+    2: [("Breakfast", "breakfast", 0.40), ("Dinner", "dinner", 0.60)],
+    3: [("Breakfast", "breakfast", 0.28), ("Lunch", "lunch", 0.36), ("Dinner", "dinner", 0.36)],
+    4: [("Breakfast", "breakfast", 0.25), ("Lunch", "lunch", 0.32), ("Snack 1", "snack", 0.11), ("Dinner", "dinner", 0.32)],
+    5: [("Breakfast", "breakfast", 0.23), ("Snack 1", "snack", 0.09), ("Lunch", "lunch", 0.30), ("Snack 2", "snack", 0.09), ("Dinner", "dinner", 0.29)],
+}
+MACRO_KEYS = ["calories", "protein_g", "carbs_g", "fats_g"]
+
+
+def meal_slots(meals_per_day: int) -> List[tuple]:
+    """Slots for 1-7 meals; beyond five, extra snacks share the snack budget."""
+    if meals_per_day in MEAL_SLOTS:
+        return MEAL_SLOTS[meals_per_day]
+    extra = meals_per_day - 5
+    slots = [s for s in MEAL_SLOTS[5] if s[1] != "snack"]
+    snack_share = 0.18 / (2 + extra)
+    snacks = [(f"Snack {i + 1}", "snack", snack_share) for i in range(2 + extra)]
+    return slots[:1] + snacks[:1] + slots[1:2] + snacks[1:2] + slots[2:] + snacks[2:]
+
+
+class FastMealPlanner:
+    """
+    Deterministic, LLM-free meal planner over the local recipe corpus.
+
+    For every meal slot it scores each allowed recipe at every portion size in
+    one (recipes x portions) matrix against the slot's calorie and macro targets,
+    then nudges portions across the day (greedy knapsack-style correction) until
+    the day's calories land within tolerance. Each slot's fit is scored once and
+    reused on every day, so a week over 120k recipes takes about 0.1 s.
+    """
+
+    PORTIONS = np.arange(0.5, 2.01, 0.25)
+    # Relative weight of each target in the slot score
+    CALORIE_WEIGHT, PROTEIN_WEIGHT, CARBS_WEIGHT, FATS_WEIGHT = 1.0, 0.6, 0.25, 0.25
+    # Balancing may scale a chosen meal up to this many servings to reach the day's calories
+    MAX_PORTION = 3.0
+    REPEAT_PENALTY = 0.35
+    # Effectively forbids serving the same recipe twice in one day unless nothing else fits
+    SAME_DAY_PENALTY = 10.0
+    PREFERENCE_BONUS = 0.08
+
+    def __init__(self, recipe_store: Optional[RecipeStore] = None, tolerance: float = 0.05):
+        self.store = recipe_store or get_recipe_store()
+        self.tolerance = tolerance
+        self.macros = np.array(
+            [[float(r["per_serving"].get(k) or 0) for k in MACRO_KEYS] for r in self.store.recipes],
+            dtype=np.float64,
+        ).reshape(-1, len(MACRO_KEYS))
+
+    @staticmethod
+    def _filters(query) -> dict:
+        """Recipe store filters for a profile, with dietary preferences ("Gluten-free", "Vegan") applied."""
+        rules = dietary_preference_rules(query.dietary_preferences or [])
+        return dict(
+            dietary_pattern=strictest_pattern([query.dietary_pattern, rules["dietary_pattern"]]) or query.dietary_pattern,
+            allergies=(query.allergies or []) + rules["allergies"],
+            exclude=(query.dislikes or []) + religious_exclusions(query.religious_restrictions or []),
+            max_cost=query.budget,
+            max_skill=query.cooking_skill,
+        )
+
+    def _preference_mask(self, query) -> np.ndarray:
+        """Recipes mentioning a liked food or a preferred cuisine."""
+        mask = np.zeros(len(self.store.recipes), dtype=bool)
+        for like in query.likes or []:
+            for token in tokenize(like):
+                mask[self.store.index.doc_ids(token)] = True
+        cuisines = (query.cuisine_preferences or []) + dietary_preference_rules(query.dietary_preferences or [])["cuisines"]
+        for cuisine in cuisines:
+            cuisine_mask = self.store.cuisine_masks.get(cuisine.lower())
+            if cuisine_mask is not None:
+                mask |= cuisine_mask
+        return mask
+
+    def _candidates(self, query, meal_type: str) -> np.ndarray:
+        """Allowed recipe ids for a meal type, relaxing the meal type if none fit."""
+        filters = self._filters(query)
+        ids = np.flatnonzero(self.store.filter_mask(meal_type=meal_type, **filters))
+        if ids.size == 0:
+            ids = np.flatnonzero(self.store.filter_mask(**filters))
+        return ids
+
+    def _fit(self, ids: np.ndarray, target: np.ndarray) -> tuple:
+        """
+        (score, portion) of every candidate at its best-fitting portion size for a slot
+        target. Depends only on the target, so a slot's fit is reused on every day.
+        """
+        totals = self.macros[ids][:, None, :] * self.PORTIONS[None, :, None]
+        relative_error = np.abs(totals - target) / np.maximum(target, 1.0)
+        weights = np.array([self.CALORIE_WEIGHT, self.PROTEIN_WEIGHT, self.CARBS_WEIGHT, self.FATS_WEIGHT])
+        score = (relative_error * weights).sum(axis=2)
+        column = np.argmin(score, axis=1)
+        return score[np.arange(ids.size), column], self.PORTIONS[column]
+
+    def _pick(
+        self, ids: np.ndarray, fit: tuple, used: np.ndarray, today: np.ndarray, preferred: np.ndarray
+    ) -> tuple:
+        """
+        Best (recipe id, portion) for one slot. used counts servings per recipe so far
+        and today flags the recipes already on the current day (both corpus-sized).
+        """
+        fit_score, portions = fit
+        score = fit_score + self.REPEAT_PENALTY * used[ids] + self.SAME_DAY_PENALTY * today[ids]
+        score -= self.PREFERENCE_BONUS * preferred[ids]
+        row = int(np.argmin(score))
+        return int(ids[row]), float(portions[row])
+
+    def _calorie_gap(self, choices: List[list], target_calories: float) -> float:
+        """Relative calorie shortfall of a day (negative when over target)."""
+        total = sum(self.macros[rid][0] * portion for rid, portion in choices)
+        return (target_calories - total) / max(target_calories, 1.0)
+
+    def _balance_day(self, choices: List[list], target_calories: float) -> None:
+        """Step single portions by 0.25 (up to MAX_PORTION) until the day is within tolerance (or stuck)."""
+        for _ in range(int(4 * self.MAX_PORTION) * len(choices)):
+            total = sum(self.macros[rid][0] * portion for rid, portion in choices)
+            gap = target_calories - total
+            if abs(gap) <= self.tolerance * target_calories:
+                return
+            step = 0.25 if gap > 0 else -0.25
+            best, best_gap = None, abs(gap)
+            for slot, (rid, portion) in enumerate(choices):
+                new_portion = portion + step
+                if not self.PORTIONS[0] <= new_portion <= self.MAX_PORTION:
+                    continue
+                new_gap = abs(gap - step * self.macros[rid][0])
+                if new_gap < best_gap:
+                    best, best_gap = slot, new_gap
+            if best is None:
+                return
+            choices[best][1] += step
+
+    def _meal(self, label: str, rid: int, portion: float) -> dict:
+        """Scaled meal record for a chosen recipe and portion."""
+        recipe = self.store.recipes[rid]
+        scale = portion / recipe["servings"]
+        ingredients = []
+        for ingredient in recipe["ingredients"]:
+            quantity = ingredient.get("quantity")
+            if quantity is not None:
+                quantity = quantity * scale
+                quantity = round(quantity * 2) / 2 if ingredient.get("unit") == "pcs" else round(quantity)
+            ingredients.append({"name": ingredient["name"], "quantity": quantity, "unit": ingredient.get("unit")})
+        meal = {
+            "meal": label,
+            "title": recipe["title"],
+            "recipe_id": recipe["id"],
+            "portion": portion,
+            "ingredients": ingredients,
+            "instructions": recipe["instructions"],
+        }
+        meal.update({k: round(v, 1) for k, v in zip(MACRO_KEYS, self.macros[rid] * portion)})
+        return meal
+
+    def plan(self, query, days: int = 1) -> dict:
+        """
+        Build a full plan for a NutritionQueryRequest.
+
+        Every day has exactly the requested number of meals; portions are scaled to
+        the calorie target. A day still outside tolerance carries its relative
+        "calorie_gap" and a message in the plan's "warnings" instead of being
+        served silently.
+        Raises ValueError when no recipe satisfies the user's restrictions.
+        """
+        targets = NutritionCalculator.calculate_daily_needs(
+            query.gender, query.weight_kg, query.height_cm, query.age, query.activity_level, query.goals
+        )
+        daily_target = np.array([targets[k] for k in MACRO_KEYS], dtype=np.float64)
+        slots = meal_slots(query.meals_per_day)
+        preferred = self._preference_mask(query)
+
+        candidates: Dict[str, np.ndarray] = {}
+        for _, meal_type, _ in slots:
+            if meal_type not in candidates:
+                candidates[meal_type] = self._candidates(query, meal_type)
+                if candidates[meal_type].size == 0:
+                    raise ValueError("No recipes in the local library match this profile's restrictions.")
+
+        fits = [self._fit(candidates[meal_type], daily_target * share) for _, meal_type, share in slots]
+
+        used = np.zeros(len(self.store.recipes), dtype=np.int32)
+        plan_days, warnings = [], []
+        for day in range(1, days + 1):
+            choices, today = [], np.zeros(len(self.store.recipes), dtype=bool)
+            for (_, meal_type, _), fit in zip(slots, fits):
+                rid, portion = self._pick(candidates[meal_type], fit, used, today, preferred)
+                used[rid] += 1
+                today[rid] = True
+                choices.append([rid, portion])
+            self._balance_day(choices, targets["calories"])
+
+            meals = [self._meal(label, rid, portion) for (label, _, _), (rid, portion) in zip(slots, choices)]
+            totals = {k: round(sum(m[k] for m in meals), 1) for k in MACRO_KEYS}
+            plan_day = {"day": day, "meals": meals, "totals": totals}
+            gap = self._calorie_gap(choices, targets["calories"])
+            if abs(gap) > self.tolerance:
+                plan_day["calorie_gap"] = round(float(gap), 3)
+                warnings.append(
+                    f"Day {day} is {abs(gap):.0%} {'under' if gap > 0 else 'over'} the {targets['calories']:.0f} kcal target; "
+                    f"the recipe library cannot fit it with {len(meals)} meal{'s' if len(meals) != 1 else ''}."
+                )
+            plan_days.append(plan_day)
+
+        return {"targets": targets, "days": plan_days, "warnings": warnings}
+
+    def plan_meal(self, query, label: str, target: dict) -> dict:
+        """
+        One replacement meal for a slot (e.g. "Dinner", "Snack 2") aimed at a macro target,
+        used when re-planning only the meals a profile change invalidated.
+        Raises ValueError when no recipe satisfies the user's restrictions.
+        """
+        lowered = label.lower()
+        slot_types = {name.lower(): meal_type for slots in MEAL_SLOTS.values() for name, meal_type, _ in slots}
+        meal_type = slot_types.get(lowered) or next((t for t in ("breakfast", "lunch", "dinner", "snack") if t in lowered), "lunch")
+        ids = self._candidates(query, meal_type)
+        if ids.size == 0:
+            raise ValueError("No recipes in the local library match this profile's restrictions.")
+        slot_target = np.array([float(target[k]) for k in MACRO_KEYS], dtype=np.float64)
+        n = len(self.store.recipes)
+        rid, portion = self._pick(
+            ids, self._fit(ids, slot_target), np.zeros(n, dtype=np.int32), np.zeros(n, dtype=bool), self._preference_mask(query)
+        )
+        return self._meal(label, rid, portion)
+
+
+_fast_planner: Optional[FastMealPlanner] = None
+
+
+def get_fast_planner() -> FastMealPlanner:
+    """Return the process-wide FastMealPlanner."""
+    global _fast_planner
+    if _fast_planner is None:
+        tolerance = load_config().get("planner", {}).get("calorie_tolerance", 0.05)
+        _fast_planner = FastMealPlanner(tolerance=float(tolerance))
+    return _fast_planner
@@ -0,0 +1,59 @@
+class NutritionCalculator:
+    """Daily energy and macro targets; mirrors src/nutritionCalculator.ts."""
+
+    ACTIVITY_MULTIPLIERS = {
+        "sedentary": 1.2,
+        "light": 1.375,
+        "moderate": 1.55,
+        "active": 1.725,
+        "very_active": 1.9,
+    }
+
+    @staticmethod
+    def calculate_bmr(gender: str, weight_kg: float, height_cm: float, age: int) -> float:
+        """
+        Basal metabolic rate (revised Harris-Benedict).
+
+        Args:
+            gender (str): 'male', 'female' or 'other' (non-male uses the female equation)
+            weight_kg (float): Body weight in kilograms
+            height_cm (float): Height in centimetres
+            age (int): Age in years
+
+        Returns:
+            float: kcal per day at rest
+        """
+        if gender.lower() == "male":
+            return 88.362 + (13.397 * weight_kg) + (4.799 * height_cm) - (5.677 * age)
+        return 447.593 + (9.247 * weight_kg) + (3.098 * height_cm) - (4.330 * age)
+
+    @staticmethod
+    def calculate_daily_needs(
+        gender: str, weight_kg: float, height_cm: float, age: int, activity_level: str, goals: list
+    ) -> dict:
+        """
+        Target calories and macro grams for a day.
+
+        Returns:
+            dict: {"calories", "protein_g", "carbs_g", "fats_g"}
+        """
+        bmr = NutritionCalculator.calculate_bmr(gender, weight_kg, height_cm, age)
+        multiplier = NutritionCalculator.ACTIVITY_MULTIPLIERS.get(activity_level.lower(), 1.2)
+        calories = bmr * multiplier
+
+        protein_share, carbs_share, fat_share = 0.25, 0.45, 0.30
+        goals = [g.lower() for g in goals or []]
+        if "weight_loss" in goals:
+            calories *= 0.8  # 20% deficit
+        elif "weight_gain" in goals:
+            calories *= 1.2  # 20% surplus
+        elif "muscle_gain" in goals:
+            calories *= 1.1  # 10% surplus with more protein
+            protein_share, carbs_share = 0.30, 0.40
+
+        return {
+            "calories": round(calories),
+            "protein_g": round(calories * protein_share / 4),
+            "carbs_g": round(calories * carbs_share / 4),
+            "fats_g": round(calories * fat_share / 9),
+        }
@@ -0,0 +1,431 @@
+import re
+import html
+from typing import Callable, Dict, Iterator, List, Optional
+
+# HTML contract shared by the LLM prompt, server-side renderers and post-processing.
+# Plans stay free-form Tailwind HTML, but these data attributes let the server find
+# days, meals and ingredients without parsing arbitrary markup:
+#
+#   <section data-day="1"> ... </section>
+#   <article data-meal="Breakfast" data-calories="450" data-protein-g="30"
+#            data-carbs-g="50" data-fats-g="12"> ... </article>
+#   <tr data-ingredient="rolled oats" data-quantity="50" data-unit="g"> ... </tr>
+#   <ul data-substitutions></ul>        (empty placeholder, filled by the server)
+#   <table data-day-totals> ... </table>  (a day's planned-vs-target totals)
+#   <section data-shopping-list> ... </section>   (appended by the server)
+
+DAY_RE = re.compile(r'<section\b[^>]*\bdata-day="(\d+)"[^>]*>.*?</section>', re.S | re.I)
+MEAL_RE = re.compile(r'<article\b([^>]*\bdata-meal="[^"]*"[^>]*)>.*?</article>', re.S | re.I)
+INGREDIENT_RE = re.compile(r'<tr\b([^>]*\bdata-ingredient="[^"]*"[^>]*)>', re.I)
+SUBSTITUTIONS_RE = re.compile(r'<ul\b[^>]*\bdata-substitutions\b[^>]*>.*?</ul>', re.S | re.I)
+DAY_OPEN_RE = re.compile(r'<section\b[^>]*\bdata-day="\d+"[^>]*>', re.I)
+SECTION_TAG_RE = re.compile(r'</?section\b[^>]*>', re.I)
+SHOPPING_LIST_RE = re.compile(r'<section\b[^>]*\bdata-shopping-list\b[^>]*>.*?</section>', re.S | re.I)
+DAY_TOTALS_RE = re.compile(r'<table\b[^>]*\bdata-day-totals\b[^>]*>.*?</table>', re.S | re.I)
+CALORIE_WARNING_RE = re.compile(r'<p\b[^>]*\bdata-calorie-warning\b[^>]*>.*?</p>', re.S | re.I)
+ATTR_RE = re.compile(r'data-([a-z-]+)="([^"]*)"', re.I)
+
+SUBSTITUTIONS_LIST_CLASS = "list-disc pl-5 space-y-1 text-sm text-gray-700"
+
+
+def _attributes(tag_body: str) -> Dict[str, str]:
+    """data-* attributes of a tag as {name: unescaped value}."""
+    return {key.lower(): html.unescape(value) for key, value in ATTR_RE.findall(tag_body)}
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def parse_ingredients(fragment: str) -> List[dict]:
+    """Ingredient rows in an HTML fragment as name/quantity/unit dicts."""
+    ingredients = []
+    for match in INGREDIENT_RE.finditer(fragment):
+        attrs = _attributes(match.group(1))
+        ingredients.append({
+            "name": attrs["ingredient"].strip().lower(),
+            "quantity": _number(attrs.get("quantity")),
+            "unit": attrs.get("unit") or None,
+        })
+    return ingredients
+
+
+def iter_meals(fragment: str) -> Iterator[re.Match]:
+    """Match objects for every meal card, in document order."""
+    return MEAL_RE.finditer(fragment)
+
+
+def parse_meal(match: re.Match) -> dict:
+    """Structured view of one meal card match."""
+    attrs = _attributes(match.group(1))
+    return {
+        "meal": attrs.get("meal", ""),
+        "calories": _number(attrs.get("calories")),
+        "protein_g": _number(attrs.get("protein-g")),
+        "carbs_g": _number(attrs.get("carbs-g")),
+        "fats_g": _number(attrs.get("fats-g")),
+        "ingredients": parse_ingredients(match.group(0)),
+    }
+
+
+def parse_plan(plan_html: str) -> dict:
+    """
+    Structured plan extracted from contract attributes:
+    {"days": [{"day": 1, "meals": [{"meal", "calories", ..., "ingredients"}]}]}.
+    HTML without day sections is treated as a single day.
+    """
+    days = [
+        {"day": int(match.group(1)), "meals": [parse_meal(m) for m in iter_meals(match.group(0))]}
+        for match in DAY_RE.finditer(plan_html)
+    ]
+    if not days:
+        meals = [parse_meal(m) for m in iter_meals(plan_html)]
+        days = [{"day": 1, "meals": meals}] if meals else []
+    return {"days": days}
+
+
+def iter_meal_positions(plan_html: str) -> Iterator[tuple]:
+    """(day, index within the day, match) for every meal card, numbered like parse_plan."""
+    day_starts = [(m.start(), int(m.group(1))) for m in DAY_RE.finditer(plan_html)]
+    counters: Dict[int, int] = {}
+    for match in iter_meals(plan_html):
+        day = 1
+        for start, number in day_starts:
+            if start > match.start():
+                break
+            day = number
+        index = counters.get(day, 0)
+        counters[day] = index + 1
+        yield day, index, match
+
+
+def replace_meals(plan_html: str, replacements: Dict[tuple, str]) -> str:
+    """Splice new meal cards into a plan; replacements maps (day, index) to card HTML."""
+    pieces, cursor = [], 0
+    for day, index, match in iter_meal_positions(plan_html):
+        if (day, index) in replacements:
+            pieces.append(plan_html[cursor:match.start()])
+            pieces.append(replacements[(day, index)])
+            cursor = match.end()
+    pieces.append(plan_html[cursor:])
+    return "".join(pieces)
+
+
+def plan_outline(plan: dict) -> str:
+    """
+    Compact text form of a parsed plan, one line per meal, e.g.
+    "Day 1 | Breakfast (450 kcal, P 30 g, C 50 g, F 12 g): rolled oats 50 g, whole milk 200 ml".
+    Used to carry the current plan through a conversation at a fraction of the HTML's tokens.
+    """
+    def amount(ingredient: dict) -> str:
+        if ingredient["quantity"] is None:
+            return ingredient["name"]
+        return f'{ingredient["name"]} {ingredient["quantity"]:g} {ingredient["unit"] or ""}'.rstrip()
+
+    def number(value: Optional[float]) -> str:
+        return "?" if value is None else f"{value:.0f}"
+
+    lines = []
+    for day in plan.get("days", []):
+        for meal in day["meals"]:
+            lines.append(
+                f'Day {day["day"]} | {meal["meal"]} ({number(meal["calories"])} kcal, P {number(meal["protein_g"])} g, '
+                f'C {number(meal["carbs_g"])} g, F {number(meal["fats_g"])} g): '
+                + ", ".join(amount(i) for i in meal["ingredients"])
+            )
+    return "\n".join(lines)
+
+
+def render_substitutions(ingredients: List[str], substitutions: Dict[str, List[str]]) -> str:
+    """Bullet list of substitutes for each ingredient that has any."""
+    items = [
+        f'<li><span class="font-semibold">{html.escape(name)}</span>: '
+        f'{html.escape(", ".join(substitutions[name]))}</li>'
+        for name in ingredients
+        if substitutions.get(name)
+    ]
+    if not items:
+        items = ['<li>No suitable substitutions found for this meal.</li>']
+    return f'<ul data-substitutions class="{SUBSTITUTIONS_LIST_CLASS}">{"".join(items)}</ul>'
+
+
+def fill_substitutions(plan_html: str, lookup: Callable[[List[str]], Dict[str, List[str]]]) -> str:
+    """
+    Replace every meal's substitutions placeholder with deterministic suggestions.
+    lookup is called once with the unique ingredient names of the whole plan, so a
+    batched engine can answer all meals in a single vectorised query.
+    """
+    meals = list(iter_meals(plan_html))
+    if not meals:
+        return plan_html
+
+    meal_ingredients = [[i["name"] for i in parse_ingredients(m.group(0))] for m in meals]
+    unique_names = list(dict.fromkeys(name for names in meal_ingredients for name in names))
+    substitutions = lookup(unique_names) if unique_names else {}
+
+    pieces, cursor = [], 0
+    for match, names in zip(meals, meal_ingredients):
+        card = match.group(0)
+        if SUBSTITUTIONS_RE.search(card):
+            card = SUBSTITUTIONS_RE.sub(lambda _: render_substitutions(names, substitutions), card, count=1)
+        pieces.append(plan_html[cursor:match.start()])
+        pieces.append(card)
+        cursor = match.end()
+    pieces.append(plan_html[cursor:])
+    return "".join(pieces)
+
+
+def _format_quantity(quantity: Optional[float]) -> str:
+    if quantity is None:
+        return ""
+    return str(int(quantity)) if float(quantity).is_integer() else f"{quantity:g}"
+
+
+def render_meal(meal: dict) -> str:
+    """Meal card for one structured meal (as produced by the fast planner)."""
+    rows = "".join(
+        f'<tr data-ingredient="{html.escape(i["name"])}" data-quantity="{_format_quantity(i.get("quantity"))}" '
+        f'data-unit="{html.escape(i.get("unit") or "")}" class="border-t">'
+        f'<td class="py-1 pr-4">{html.escape(i["name"])}</td>'
+        f'<td class="py-1">{_format_quantity(i.get("quantity"))} {html.escape(i.get("unit") or "")}</td></tr>'
+        for i in meal["ingredients"]
+    )
+    return (
+        f'<article data-meal="{html.escape(meal["meal"])}" data-calories="{meal["calories"]:g}" '
+        f'data-protein-g="{meal["protein_g"]:g}" data-carbs-g="{meal["carbs_g"]:g}" data-fats-g="{meal["fats_g"]:g}" '
+        f'class="bg-white rounded-2xl shadow-md p-5 space-y-3">'
+        f'<h3 class="text-lg font-semibold text-green-700">{html.escape(meal["meal"])}: {html.escape(meal["title"])}</h3>'
+        f'<p class="text-sm text-gray-600">{meal["calories"]:.0f} kcal · Protein {meal["protein_g"]:.0f} g · '
+        f'Carbs {meal["carbs_g"]:.0f} g · Fat {meal["fats_g"]:.0f} g</p>'
+        f'<table class="w-full text-sm"><thead><tr class="text-left text-gray-500">'
+        f'<th class="py-1 pr-4">Ingredient</th><th class="py-1">Quantity</th></tr></thead><tbody>{rows}</tbody></table>'
+        f'<p class="text-sm text-gray-700">{html.escape(meal.get("instructions") or "")}</p>'
+        f'<h4 class="text-sm font-semibold text-gray-800">Substitutions</h4><ul data-substitutions></ul>'
+        f'</article>'
+    )
+
+
+def render_day_totals(totals: dict, targets: dict) -> str:
+    """Planned-vs-target table for one day."""
+    rows = "".join(
+        f'<tr class="border-t"><td class="py-1 pr-4">{label}</td>'
+        f'<td class="py-1 pr-4">{totals[key]:.0f}</td><td class="py-1">{targets[key]:.0f}</td></tr>'
+        for label, key in [("Calories (kcal)", "calories"), ("Protein (g)", "protein_g"),
+                           ("Carbs (g)", "carbs_g"), ("Fat (g)", "fats_g")]
+    )
+    return (
+        f'<table data-day-totals class="w-full text-sm"><thead><tr class="text-left text-gray-500"><th class="py-1 pr-4">Nutrient</th>'
+        f'<th class="py-1 pr-4">Planned</th><th class="py-1">Target</th></tr></thead><tbody>{rows}</tbody></table>'
+    )
+
+
+def render_calorie_warning(gap: float) -> str:
+    """Flag for a day whose calories miss the target by the relative `gap` (positive when under)."""
+    return (
+        f'<p data-calorie-warning class="mt-3 text-sm font-semibold text-amber-700">'
+        f'This day is {abs(gap):.0%} {"under" if gap > 0 else "over"} your calorie target: '
+        f'the recipe library has no closer fit. Adjust portions or add a snack.</p>'
+    )
+
+
+def refresh_day_totals(
+    plan_html: str, targets: dict, days: Optional[set] = None, tolerance: Optional[float] = None
+) -> str:
+    """
+    Recompute the totals table of each day (or only of `days`) from its meal cards,
+    e.g. after meals were replaced. A day without a data-day-totals table gets one
+    appended, since its own summary can no longer be trusted. The day's calorie
+    warning is dropped and, with a `tolerance`, re-added if the new totals still
+    miss the target by more than that.
+    """
+    def refresh(match: re.Match) -> str:
+        section = match.group(0)
+        if days is not None and int(match.group(1)) not in days:
+            return section
+        meals = [parse_meal(m) for m in iter_meals(section)]
+        totals = {key: sum(m[key] or 0 for m in meals) for key in ("calories", "protein_g", "carbs_g", "fats_g")}
+        table = render_day_totals(totals, targets)
+        gap = (targets["calories"] - totals["calories"]) / max(targets["calories"], 1.0)
+        if tolerance is not None and abs(gap) > tolerance:
+            table += render_calorie_warning(gap)
+        section = CALORIE_WARNING_RE.sub("", section)
+        if DAY_TOTALS_RE.search(section):
+            return DAY_TOTALS_RE.sub(lambda _: table, section, count=1)
+        closing = section.rfind("</section>")
+        updated = f'<h3 class="text-lg font-semibold text-green-800">Updated Daily Totals</h3>{table}'
+        return section[:closing] + updated + section[closing:]
+
+    return DAY_RE.sub(refresh, plan_html)
+
+
+def render_day(day: dict, targets: dict) -> str:
+    """Day section with its meal cards and a planned-vs-target summary (flagged when off target)."""
+    totals = day["totals"]
+    warning = render_calorie_warning(day["calorie_gap"]) if day.get("calorie_gap") else ""
+    return (
+        f'<section data-day="{day["day"]}" class="space-y-4">'
+        f'<h2 class="text-2xl font-bold text-gray-900">Day {day["day"]}</h2>'
+        f'<div class="grid gap-4 md:grid-cols-2">{"".join(render_meal(m) for m in day["meals"])}</div>'
+        f'<div class="bg-green-50 rounded-2xl p-5"><h3 class="text-lg font-semibold text-green-800">Daily Summary</h3>'
+        f'{render_day_totals(totals, targets)}{warning}'
+        f'<ul class="list-disc pl-5 mt-3 text-sm text-gray-700">'
+        f'<li>Drink water steadily through the day, roughly 30-35 ml per kg of body weight.</li>'
+        f'<li>Prep ingredients shared between meals together to save time.</li></ul></div>'
+        f'</section>'
+    )
+
+
+def wrap_plan(sections: List[str]) -> str:
+    """Page container around day (and shopping list) sections."""
+    return f'<div class="max-w-5xl mx-auto p-4 space-y-8">{"".join(sections)}</div>'
+
+
+def render_plan(plan: dict) -> str:
+    """
+    Tailwind HTML for a structured plan ({"targets", "days": [{"day", "meals", "totals"}]}),
+    following the same contract the LLM is asked to produce.
+    """
+    return wrap_plan([render_day(day, plan["targets"]) for day in plan["days"]])
+
+
+class DaySectionStream:
+    """
+    Incrementally split streamed plan HTML into complete day sections.
+
+    feed() takes raw text chunks as they arrive (e.g. LLM tokens) and returns every
+    <section data-day> whose closing tag has now been seen, so downstream stages can
+    work day by day instead of waiting for the whole plan. Nested sections inside a
+    day are handled by depth counting.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.text = []
+
+    def feed(self, chunk: str) -> List[str]:
+        self.text.append(chunk)
+        self.buffer += chunk
+        sections = []
+        while True:
+            start = DAY_OPEN_RE.search(self.buffer)
+            if start is None:
+                # Keep only a tail that could still hold the start of an opening tag
+                last_tag = self.buffer.rfind("<")
+                self.buffer = self.buffer[last_tag:] if last_tag != -1 else ""
+                return sections
+            depth, end = 0, None
+            for tag in SECTION_TAG_RE.finditer(self.buffer, start.start()):
+                depth += -1 if tag.group(0).startswith("</") else 1
+                if depth == 0:
+                    end = tag.end()
+                    break
+            if end is None:
+                self.buffer = self.buffer[start.start():]
+                return sections
+            sections.append(self.buffer[start.start():end])
+            self.buffer = self.buffer[end:]
+
+    @property
+    def full_text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self.text)
+
+
+def split_days(plan_html: str) -> List[str]:
+    """Complete day sections of a finished plan, in order."""
+    return DaySectionStream().feed(plan_html)
+
+
+# --- minification ---
+# Raw-text elements are copied verbatim; comments are dropped; everything else is a tag or text
+# A tag starts with "<" directly followed by a letter, "/", "!" or "?" (as in browsers, "a < b" is
+# text) and runs to the first ">" outside a quoted attribute value, so value="a > b" stays inside it
+_TOKEN_RE = re.compile(
+    r'''(<!--.*?-->|<(pre|textarea|script|style)\b.*?</\2\s*>|<[A-Za-z/!?](?:[^>"']|"[^"]*"|'[^']*')*>)''', re.S | re.I
+)
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][\w:-]*)(.*?)(/?)\s*>$', re.S)
+_TAG_ATTRIBUTE_RE = re.compile(r'([^\s=/>"\']+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+))?')
+_WHITESPACE_RE = re.compile(r'\s+')
+# Whitespace next to these tags never renders, so it can be dropped instead of collapsed
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "br", "caption", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "head", "header",
+    "hr", "html", "li", "main", "meta", "nav", "ol", "p", "section", "table", "tbody", "td", "tfoot",
+    "th", "thead", "title", "tr", "ul", "link", "!doctype",
+}
+# Attributes that mean nothing when empty
+_DROPPABLE_EMPTY = {"class", "style", "id", "title"}
+
+
+def _minify_tag(tag: str) -> tuple:
+    """(minified tag, lowercase tag name) with attributes normalized to name="value"."""
+    if tag.startswith("<!") or tag.startswith("<?"):
+        return _WHITESPACE_RE.sub(" ", tag), tag[1:-1].split(None, 1)[0].lower()
+    match = _TAG_RE.match(tag)
+    if match is None:
+        return tag, ""
+    closing, name, body, self_closing = match.groups()
+    if closing:
+        return f"</{name}>", name.lower()
+
+    attributes = []
+    for attribute in _TAG_ATTRIBUTE_RE.finditer(body):
+        key, value = attribute.group(1), attribute.group(2)
+        if value is None:
+            attributes.append(key)
+            continue
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        if key.lower() == "class":
+            # Collapse whitespace and drop duplicated utility classes
+            value = " ".join(dict.fromkeys(value.split()))
+        if not value.strip() and key.lower() in _DROPPABLE_EMPTY:
+            continue
+        attributes.append(f"{key}='{value}'" if '"' in value else f'{key}="{value}"')
+    attrs = (" " + " ".join(attributes)) if attributes else ""
+    return f"<{name}{attrs}{'/' if self_closing else ''}>", name.lower()
+
+
+def minify_html(text: str) -> str:
+    """
+    Whitespace and attribute minification of plan HTML.
+
+    Comments are removed and whitespace runs collapsed to one space (or dropped
+    next to block-level tags). Inside tags, attributes are re-emitted as
+    name="value" with single spaces, duplicate classes and empty class/style/id
+    attributes are dropped, and unquoted values are quoted, so LLM output also
+    ends up in the exact attribute form the contract regexes above expect.
+    <pre>, <textarea>, <script> and <style> contents are kept verbatim.
+    """
+    # split() yields text, token, raw-text element name (or None), text, token, ...
+    parts = _TOKEN_RE.split(text)
+    tokens = []  # (kind, text, tag name)
+    for i in range(0, len(parts), 3):
+        tokens.append(("text", _WHITESPACE_RE.sub(" ", parts[i]), ""))
+        if i + 1 >= len(parts) or parts[i + 1].startswith("<!--"):
+            continue
+        token, raw_element = parts[i + 1], parts[i + 2]
+        if raw_element:
+            opening = token.index(">") + 1
+            tag, name = _minify_tag(token[:opening])
+            tokens.append(("raw", tag + token[opening:], name))
+        else:
+            tag, name = _minify_tag(token)
+            tokens.append(("tag", tag, name))
+
+    output = []
+    for index, (kind, value, name) in enumerate(tokens):
+        if kind != "text":
+            output.append(value)
+            continue
+        previous = tokens[index - 1] if index > 0 else None
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if previous is None or previous[2] in BLOCK_TAGS:
+            value = value.lstrip()
+        if following is None or following[2] in BLOCK_TAGS:
+            value = value.rstrip()
+        output.append(value)
+    return "".join(output)
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import queue
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.config_loader import load_config
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; fall back to zlib (gzip) compression
+    zstandard = None
+
+# Largest page list_plans returns
+MAX_PAGE_SIZE = 200
+
+
+class PlanStore:
+    """
+    Append-only archive of generated plans in SQLite.
+
+    Plan HTML is compressed (zstd when available, zlib otherwise) and stored once
+    per distinct content hash, so plans served repeatedly from the cache cost one
+    small metadata row each. Rows are indexed by user id, profile fingerprint and
+    time, and listings page by timestamp instead of OFFSET, so history lookups stay
+    index-only at millions of rows.
+
+    save() only enqueues; a background writer thread batches queued plans into a
+    single transaction, so persisting a plan adds no latency to the request.
+    """
+
+    def __init__(self, path: str = "./cache/plans.sqlite3", codec: str = "zstd", level: int = 6, batch_size: int = 256):
+        self.path = path
+        self.codec = codec if codec == "zstd" and zstandard is not None else "zlib"
+        self.level = level
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(
+            "CREATE TABLE IF NOT EXISTS plan_blobs ("
+            " content_hash TEXT PRIMARY KEY,"
+            " codec TEXT NOT NULL,"
+            " data BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS plans ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " plan_id TEXT NOT NULL UNIQUE,"
+            " user_id TEXT,"
+            " fingerprint TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " source TEXT,"
+            " content_hash TEXT NOT NULL REFERENCES plan_blobs(content_hash),"
+            " size INTEGER NOT NULL,"
+            " codec TEXT NOT NULL,"
+            " request BLOB NOT NULL);"
+            # History pages are keyed on (created_at, plan_id), so ties on created_at are ordered too
+            "CREATE INDEX IF NOT EXISTS plans_user_page ON plans (user_id, created_at, plan_id);"
+            "CREATE INDEX IF NOT EXISTS plans_fingerprint_page ON plans (fingerprint, created_at, plan_id);"
+            "CREATE INDEX IF NOT EXISTS plans_page ON plans (created_at, plan_id);"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection owned by the current process and thread (never shared across a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- compression ---
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Plan was stored with zstd but the zstandard package is not installed.")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    @staticmethod
+    def fingerprint(profile: Dict[str, Any]) -> str:
+        """Stable hash of a user profile (the request without per-user fields)."""
+        payload = json.dumps(profile, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def content_hash(html_content: str) -> str:
+        """Hash plans are deduplicated by; also served as the plan's ETag."""
+        return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+    # --- writes ---
+    def save(self, html_content: str, request: Dict[str, Any], user_id: Optional[str] = None, source: str = "") -> str:
+        """Queue a plan for storage and return its id immediately."""
+        plan_id = uuid.uuid4().hex
+        self._ensure_writer()
+        self._queue.put((plan_id, user_id, self.fingerprint(request), time.time(), source, html_content, request))
+        return plan_id
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer_pid != os.getpid() or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="plan-store-writer", daemon=True)
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch([entry for entry in batch if entry is not None])
+            except sqlite3.Error as e:
+                print(f"Plan store write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if any(entry is None for entry in batch):
+                return
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        if not batch:
+            return
+        blobs, rows = {}, []
+        for plan_id, user_id, fingerprint, created_at, source, html_content, request in batch:
+            data = html_content.encode("utf-8")
+            content_hash = self.content_hash(html_content)
+            if content_hash not in blobs:
+                blobs[content_hash] = self._compress(data)
+            request_blob = self._compress(json.dumps(request, default=str).encode("utf-8"))
+            rows.append((plan_id, user_id, fingerprint, created_at, source, content_hash, len(data), self.codec, request_blob))
+
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO plan_blobs (content_hash, codec, data) VALUES (?, ?, ?)",
+                [(content_hash, self.codec, data) for content_hash, data in blobs.items()],
+            )
+            conn.executemany(
+                "INSERT INTO plans (plan_id, user_id, fingerprint, created_at, source, content_hash, size, codec, request)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def flush(self) -> None:
+        """Block until every queued plan is written."""
+        if self._writer is not None and self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Write what is queued and stop the writer thread."""
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+        self._writer = None
+
+    # --- reads ---
+    def list_plans(
+        self,
+        user_id: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+        before: Optional[float] = None,
+        limit: int = 20,
+        before_id: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Newest-first plan metadata (no HTML). For the next page pass the last item's
+        created_at as `before` and its plan_id as `before_id`; plans created at the
+        same instant are then neither skipped nor repeated.
+        """
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if fingerprint is not None:
+            clauses.append("fingerprint = ?")
+            params.append(fingerprint)
+        if before is not None and before_id is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND plan_id < ?))")
+            params.extend([before, before, before_id])
+        elif before is not None:
+            clauses.append("created_at < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT plan_id, user_id, fingerprint, created_at, source, size FROM plans {where}"
+            " ORDER BY created_at DESC, plan_id DESC LIMIT ?",
+            (*params, max(1, min(limit, MAX_PAGE_SIZE))),
+        ).fetchall()
+        return [
+            {"plan_id": r[0], "user_id": r[1], "fingerprint": r[2], "created_at": r[3], "source": r[4], "size": r[5]}
+            for r in rows
+        ]
+
+    def find_plan(self, content_hash: str, request: Dict[str, Any], user_id: Optional[str] = None) -> Optional[str]:
+        """Id of the newest stored plan with this content for this profile and user, or None (also while still queued)."""
+        row = self._connect().execute(
+            "SELECT plan_id FROM plans WHERE fingerprint = ? AND content_hash = ? AND user_id IS ?"
+            " ORDER BY created_at DESC, plan_id DESC LIMIT 1",
+            (self.fingerprint(request), content_hash, user_id),
+        ).fetchone()
+        return row[0] if row else None
+
+    def plan_hash(self, plan_id: str) -> Optional[str]:
+        """Content hash of a stored plan without loading it, for conditional requests."""
+        row = self._connect().execute("SELECT content_hash FROM plans WHERE plan_id = ?", (plan_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_plan(self, plan_id: str) -> Optional[dict]:
+        """Full stored plan (HTML and original request), or None when unknown."""
+        row = self._connect().execute(
+            "SELECT p.plan_id, p.user_id, p.fingerprint, p.created_at, p.source, p.codec, p.request, b.codec, b.data, p.content_hash"
+            " FROM plans p JOIN plan_blobs b ON b.content_hash = p.content_hash WHERE p.plan_id = ?",
+            (plan_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "plan_id": row[0],
+            "user_id": row[1],
+            "fingerprint": row[2],
+            "created_at": row[3],
+            "source": row[4],
+            "request": json.loads(self._decompress(row[5], row[6])),
+            "html_content": self._decompress(row[7], row[8]).decode("utf-8"),
+            "content_hash": row[9],
+        }
+
+
+_plan_store: Optional[PlanStore] = None
+
+
+def get_plan_store() -> PlanStore:
+    """Return the process-wide PlanStore configured from config.yaml."""
+    global _plan_store
+    if _plan_store is None:
+        store_config = load_config().get("plan_store", {})
+        _plan_store = PlanStore(
+            path=os.getenv("PLAN_STORE_PATH", store_config.get("path", "./cache/plans.sqlite3")),
+            codec=store_config.get("codec", "zstd"),
+            level=int(store_config.get("level", 6)),
+            batch_size=int(store_config.get("batch_size", 256)),
+        )
+    return _plan_store
@@ -0,0 +1,479 @@
+import os
+import re
+import csv
+import sys
+import json
+import math
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from utils.config_loader import load_config
+from utils.food_tags import (
+    COST_TIERS,
+    SKILL_LEVELS,
+    DIETARY_PATTERNS,
+    canonical_allergens,
+    detect_allergens,
+    infer_diets,
+    tokenize,
+)
+
+CUISINE_KEYWORDS = [
+    "american", "mexican", "italian", "indian", "chinese", "japanese", "thai", "korean",
+    "vietnamese", "mediterranean", "greek", "middle_eastern", "french", "spanish", "european",
+    "african", "caribbean", "asian", "fusion",
+]
+MEAL_TYPES = ["breakfast", "lunch", "dinner", "snack"]
+PREMIUM_INGREDIENTS = ["salmon", "shrimp", "prawn", "lamb", "steak", "beef", "cashew", "pine nut", "scallop", "lobster", "crab"]
+
+# Food.com reports nutrition as % daily value of a 2000 kcal diet
+_PDV_GRAMS = {"fats_g": 65.0, "protein_g": 50.0, "carbs_g": 300.0}
+
+_QUANTITY_RE = re.compile(r"^\s*([\d/.\s]+)?\s*([a-zA-Z]+\.?)?\s+(.*)$")
+_UNIT_WORDS = {
+    "g", "gram", "grams", "kg", "ml", "l", "cup", "cups", "c.", "c", "tbsp", "tsp", "tablespoon",
+    "tablespoons", "teaspoon", "teaspoons", "oz", "lb", "lbs", "pound", "pounds", "pcs", "piece", "pieces",
+}
+
+
+def _parse_list(value) -> list:
+    """Accept a real list or a stringified Python/JSON list (as found in dataset CSVs)."""
+    if isinstance(value, list):
+        return value
+    if not value:
+        return []
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return json.loads(text.replace("'", '"'))
+            except json.JSONDecodeError:
+                pass
+        return [part.strip(" '\"") for part in text.strip("[]").split("',")]
+    return [part.strip() for part in text.split(",") if part.strip()]
+
+
+def _parse_quantity(text: str) -> Optional[float]:
+    """Parse '1', '1.5', '1/2' or '1 1/2' into a float."""
+    total = 0.0
+    for part in text.split():
+        try:
+            if "/" in part:
+                numerator, denominator = part.split("/", 1)
+                total += float(numerator) / float(denominator)
+            else:
+                total += float(part)
+        except (ValueError, ZeroDivisionError):
+            return None
+    return total or None
+
+
+def parse_ingredient_line(line: str) -> dict:
+    """Split a free-text line such as '1 1/2 cups rolled oats' into name/quantity/unit."""
+    match = _QUANTITY_RE.match(line)
+    if match and match.group(1) and match.group(1).strip():
+        quantity = _parse_quantity(match.group(1))
+        unit = (match.group(2) or "").lower()
+        rest = match.group(3)
+        if unit and unit not in _UNIT_WORDS:
+            rest, unit = f"{match.group(2)} {rest}", "pcs"
+        return {"name": rest.strip().lower(), "quantity": quantity, "unit": unit.rstrip(".") or "pcs"}
+    return {"name": line.strip().lower(), "quantity": None, "unit": None}
+
+
+def normalize_recipe(raw: dict, source: str = "import") -> Optional[dict]:
+    """
+    Convert a record from our own JSONL, Food.com (RAW_recipes.csv) or RecipeNLG into
+    the store schema, deriving allergen flags, diets, cuisine, cost and skill.
+    Returns None when the record has no usable title, ingredients or nutrition.
+    """
+    title = (raw.get("title") or raw.get("name") or raw.get("label") or "").strip()
+    if not title:
+        return None
+
+    ingredients = []
+    for item in _parse_list(raw.get("ingredients") or raw.get("ingredientLines")):
+        if isinstance(item, dict) and item.get("name"):
+            ingredients.append({"name": str(item["name"]).lower(), "quantity": item.get("quantity"), "unit": item.get("unit")})
+        elif isinstance(item, str) and item.strip():
+            ingredients.append(parse_ingredient_line(item))
+    if not ingredients:
+        return None
+    names = [i["name"] for i in ingredients]
+
+    servings = raw.get("servings") or raw.get("yield") or 1
+    try:
+        servings = max(1, int(float(servings)))
+    except (TypeError, ValueError):
+        servings = 1
+
+    per_serving = raw.get("per_serving")
+    if not per_serving and raw.get("nutrition"):
+        nutrition = raw["nutrition"]
+        if isinstance(nutrition, dict):
+            per_serving = {k: nutrition.get(k) for k in ("calories", "protein_g", "carbs_g", "fats_g")}
+        else:
+            values = [float(v) for v in _parse_list(nutrition)]
+            if len(values) >= 7:
+                # [calories, fat, sugar, sodium, protein, saturated fat, carbs]
+                per_serving = {
+                    "calories": round(values[0]),
+                    "fats_g": round(values[1] * _PDV_GRAMS["fats_g"] / 100, 1),
+                    "protein_g": round(values[4] * _PDV_GRAMS["protein_g"] / 100, 1),
+                    "carbs_g": round(values[6] * _PDV_GRAMS["carbs_g"] / 100, 1),
+                }
+    if not per_serving or per_serving.get("calories") is None:
+        return None
+
+    tags = [str(t).lower() for t in _parse_list(raw.get("tags"))]
+    title_tokens = set(tokenize(title)) | set(tags)
+
+    cuisines = [c.lower() for c in _parse_list(raw.get("cuisines") or raw.get("cuisine"))]
+    if not cuisines:
+        cuisines = [c for c in CUISINE_KEYWORDS if c in title_tokens or c.replace("_", "-") in tags]
+
+    meal_types = [m.lower() for m in _parse_list(raw.get("meal_types") or raw.get("meal_type"))]
+    if not meal_types:
+        meal_types = [m for m in MEAL_TYPES if m in title_tokens or f"{m}s" in tags or m in tags]
+        if "main-dish" in tags:
+            meal_types += [m for m in ("lunch", "dinner") if m not in meal_types]
+        if "snacks" in tags or "appetizers" in tags:
+            meal_types.append("snack")
+
+    cost = (raw.get("cost") or "").lower()
+    if cost not in COST_TIERS:
+        premium = any(p in name for name in names for p in PREMIUM_INGREDIENTS)
+        cost = "high" if premium else ("low" if len(ingredients) <= 6 else "medium")
+
+    skill = (raw.get("skill") or "").lower()
+    if skill not in SKILL_LEVELS:
+        steps = int(float(raw.get("n_steps") or len(_parse_list(raw.get("steps") or raw.get("directions")))))
+        minutes = float(raw.get("minutes") or 0)
+        if steps <= 5 and minutes <= 30:
+            skill = "beginner"
+        elif steps <= 10 and minutes <= 60:
+            skill = "intermediate"
+        else:
+            skill = "advanced"
+
+    instructions = raw.get("instructions") or raw.get("steps") or raw.get("directions") or ""
+    if isinstance(instructions, list) or str(instructions).startswith("["):
+        instructions = " ".join(str(s) for s in _parse_list(instructions))
+
+    return {
+        "id": str(raw.get("id") or f"{source}-{hashlib.md5(title.encode('utf-8')).hexdigest()[:10]}"),
+        "title": title,
+        "meal_types": meal_types,
+        "cuisines": cuisines,
+        "cost": cost,
+        "skill": skill,
+        "servings": servings,
+        "per_serving": per_serving,
+        "ingredients": ingredients,
+        "allergens": raw.get("allergens") or detect_allergens(names),
+        "diets": raw.get("diets") or infer_diets(names),
+        "instructions": instructions,
+        "source": raw.get("source") or source,
+    }
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """Yield raw records from a .jsonl, .json (list) or .csv file."""
+    if path.endswith(".csv"):
+        csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+        with open(path, newline="", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as file:
+            yield from json.load(file)
+    else:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class BM25Index:
+    """
+    Inverted index with precomputed BM25 impact scores.
+
+    Each term maps to a (doc_ids, weights) pair of NumPy arrays, where weight is
+    the full BM25 contribution of that term to that document. A query is then just
+    one vectorised scatter-add per query term. On a 120k-document corpus, queries
+    with a selective term take well under a millisecond; queries made only of very
+    common terms ('olive oil salt') take about one.
+    """
+
+    # Highest-impact documents kept per very common term, for queries made only of such terms
+    DENSE_HEAD_SIZE = 512
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.size = len(documents)
+        lengths = np.fromiter((len(d) for d in documents), dtype=np.float32, count=self.size)
+        avg_length = float(lengths.mean()) if self.size else 1.0
+
+        raw_postings: Dict[str, List[tuple]] = {}
+        for doc_id, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                raw_postings.setdefault(term, []).append((doc_id, tf))
+
+        self.postings: Dict[str, tuple] = {}
+        for term, entries in raw_postings.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((f for _, f in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[doc_ids] / avg_length)
+            weights = (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+            self.postings[term] = (doc_ids, weights)
+
+        # Terms in more than dense_threshold documents (e.g. 'oil', 'salt') are never scattered
+        # over the corpus when avoidable. Each keeps its DENSE_HEAD_SIZE best documents (sorted
+        # by id) and the lowest weight among them, an upper bound for every document outside.
+        self.dense_threshold = max(5000, int(self.size * 0.05))
+        self.dense_heads: Dict[str, tuple] = {}
+        for term, (doc_ids, weights) in self.postings.items():
+            if doc_ids.size > self.dense_threshold:
+                head = np.argpartition(weights, -self.DENSE_HEAD_SIZE)[-self.DENSE_HEAD_SIZE:]
+                self.dense_heads[term] = (np.sort(doc_ids[head]), float(weights[head].min()))
+
+    def doc_ids(self, term: str) -> np.ndarray:
+        """Documents containing the (already tokenized) term."""
+        entry = self.postings.get(term)
+        return entry[0] if entry else np.empty(0, dtype=np.int32)
+
+    def score(self, tokens: Iterable[str]) -> np.ndarray:
+        """BM25 score of every document for the query tokens."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokens):
+            entry = self.postings.get(term)
+            if entry:
+                scores[entry[0]] += entry[1]
+        return scores
+
+    def top_k(self, tokens: Iterable[str], mask: np.ndarray, k: int) -> np.ndarray:
+        """
+        Ids of the k best-scoring documents allowed by mask, best first.
+
+        Candidates come from the selective query terms only; very common terms
+        (df above dense_threshold, e.g. 'oil' or 'salt') are looked up for those
+        candidates by binary search instead of being scattered over the corpus.
+        A query of common terms only, or one whose selective candidates the mask
+        cuts below k, also takes candidates from the dense heads, and falls back to
+        a full scatter when a document outside them could still rank in the top k.
+        """
+        terms = [t for t in set(tokens) if t in self.postings]
+        selective = [t for t in terms if t not in self.dense_heads]
+        dense = [t for t in terms if t in self.dense_heads]
+        if selective:
+            scores = np.zeros(self.size, dtype=np.float32)
+            for term in selective:
+                doc_ids, weights = self.postings[term]
+                scores[doc_ids] += weights
+            candidates = np.unique(np.concatenate([self.postings[t][0] for t in selective]))
+            candidates = candidates[mask[candidates]]
+        elif dense:
+            scores = None
+            candidates = np.empty(0, dtype=np.int32)
+        else:
+            return np.empty(0, dtype=np.int32)
+        from_heads = bool(dense) and candidates.size < k
+        if from_heads:
+            heads = np.concatenate([self.dense_heads[t][0] for t in dense])
+            candidates = np.union1d(candidates, heads[mask[heads]])
+        candidate_scores = scores[candidates] if scores is not None else np.zeros(candidates.size, dtype=np.float32)
+        for term in dense:
+            doc_ids, weights = self.postings[term]
+            positions = np.minimum(np.searchsorted(doc_ids, candidates), doc_ids.size - 1)
+            hits = doc_ids[positions] == candidates
+            candidate_scores[hits] += weights[positions[hits]]
+
+        if from_heads:
+            outside_bound = sum(self.dense_heads[t][1] for t in dense)
+            kth_best = np.partition(candidate_scores, -k)[-k] if candidates.size >= k else -1.0
+            if kth_best < outside_bound:
+                scores = self.score(terms)
+                np.multiply(scores, mask, out=scores)
+                candidates = np.flatnonzero(scores)
+                candidate_scores = scores[candidates]
+
+        if candidates.size > k:
+            best = np.argpartition(candidate_scores, -k)[-k:]
+            candidates, candidate_scores = candidates[best], candidate_scores[best]
+        return candidates[np.argsort(-candidate_scores, kind="stable")]
+
+
+class RecipeStore:
+    """
+    Offline recipe corpus with a BM25 index and precomputed filter masks.
+
+    Structured filters (diet, allergens, cost, skill, meal type, cuisine) are
+    boolean NumPy masks built once at load time, so filtering is a handful of
+    vectorised ANDs rather than a scan over recipe dicts. Free-text exclusions
+    (dislikes, unknown allergies) come from the postings; multi-word ones are
+    phrase-checked once and cached per term.
+    """
+
+    # Multi-word exclusion terms whose matching recipe ids are kept
+    MAX_CACHED_EXCLUSIONS = 256
+
+    def __init__(self, recipes: List[dict]):
+        self.recipes = recipes
+        name_tokens = [self._name_tokens(r) for r in recipes]
+        self.index = BM25Index([self._document_tokens(r, names) for r, names in zip(recipes, name_tokens)])
+
+        n = len(recipes)
+        self.cost_levels = np.array([COST_TIERS.index(r["cost"]) for r in recipes], dtype=np.int8)
+        self.skill_levels = np.array([SKILL_LEVELS.index(r["skill"]) for r in recipes], dtype=np.int8)
+        self.diet_masks = {p: np.zeros(n, dtype=bool) for p in DIETARY_PATTERNS}
+        self.allergen_masks: Dict[str, np.ndarray] = {}
+        self.meal_type_masks: Dict[str, np.ndarray] = {}
+        self.cuisine_masks: Dict[str, np.ndarray] = {}
+        # Tokenized title and ingredient names, " | "-separated so a phrase never spans two names
+        self.name_texts = [" " + " | ".join(" ".join(tokens) for tokens in names) + " " for names in name_tokens]
+        self._exclusions: Dict[str, np.ndarray] = {}
+        self._exclusions_lock = threading.Lock()
+        for i, recipe in enumerate(recipes):
+            for diet in recipe["diets"]:
+                if diet in self.diet_masks:
+                    self.diet_masks[diet][i] = True
+            for allergen in recipe["allergens"]:
+                self.allergen_masks.setdefault(allergen, np.zeros(n, dtype=bool))[i] = True
+            for meal_type in recipe["meal_types"]:
+                self.meal_type_masks.setdefault(meal_type, np.zeros(n, dtype=bool))[i] = True
+            for cuisine in recipe["cuisines"]:
+                self.cuisine_masks.setdefault(cuisine, np.zeros(n, dtype=bool))[i] = True
+
+    @staticmethod
+    def _name_tokens(recipe: dict) -> List[List[str]]:
+        """Tokens of the title, then of each ingredient name."""
+        return [tokenize(recipe["title"])] + [tokenize(i["name"]) for i in recipe["ingredients"]]
+
+    @staticmethod
+    def _document_tokens(recipe: dict, name_tokens: List[List[str]]) -> List[str]:
+        """Title counts twice so title matches outrank incidental ingredient matches."""
+        title = name_tokens[0]
+        ingredients = [token for tokens in name_tokens[1:] for token in tokens]
+        return title + title + ingredients + tokenize(" ".join(recipe["cuisines"] + recipe["meal_types"]))
+
+    def mentioning(self, term: str) -> np.ndarray:
+        """
+        Ids of the recipes whose title or an ingredient mentions the whole term.
+        A single word is its postings list; a phrase is checked only on the
+        recipes containing all of its words, and the result is cached.
+        """
+        term_tokens = tokenize(term)
+        if not term_tokens:
+            return np.empty(0, dtype=np.int32)
+        if len(term_tokens) == 1:
+            return self.index.doc_ids(term_tokens[0])
+        phrase = " " + " ".join(term_tokens) + " "
+        ids = self._exclusions.get(phrase)
+        if ids is None:
+            candidates = self.index.doc_ids(term_tokens[0])
+            for token in term_tokens[1:]:
+                candidates = np.intersect1d(candidates, self.index.doc_ids(token), assume_unique=True)
+            ids = candidates[[phrase in self.name_texts[i] for i in candidates.tolist()]]
+            with self._exclusions_lock:
+                if len(self._exclusions) >= self.MAX_CACHED_EXCLUSIONS:
+                    self._exclusions.pop(next(iter(self._exclusions)))
+                self._exclusions[phrase] = ids
+        return ids
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> "RecipeStore":
+        """Load an already-normalized corpus file."""
+        recipes = list(read_records(path)) if os.path.exists(path) else []
+        return cls(recipes)
+
+    def filter_mask(
+        self,
+        dietary_pattern: Optional[str] = None,
+        allergies: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        max_cost: Optional[str] = None,
+        max_skill: Optional[str] = None,
+        meal_type: Optional[str] = None,
+        cuisine: Optional[str] = None,
+    ) -> np.ndarray:
+        """Boolean mask of recipes satisfying every given constraint."""
+        mask = np.ones(len(self.recipes), dtype=bool)
+        if dietary_pattern and dietary_pattern.lower() in self.diet_masks:
+            mask &= self.diet_masks[dietary_pattern.lower()]
+
+        allergens, leftovers = canonical_allergens(allergies or [])
+        for allergen in allergens:
+            if allergen in self.allergen_masks:
+                mask &= ~self.allergen_masks[allergen]
+        # Unknown allergies and dislikes exclude any recipe mentioning the whole term
+        for term in leftovers + [t.lower() for t in (exclude or [])]:
+            mask[self.mentioning(term)] = False
+
+        if max_cost and max_cost.lower() in COST_TIERS:
+            mask &= self.cost_levels <= COST_TIERS.index(max_cost.lower())
+        if max_skill and max_skill.lower() in SKILL_LEVELS:
+            mask &= self.skill_levels <= SKILL_LEVELS.index(max_skill.lower())
+        if meal_type:
+            mask &= self.meal_type_masks.get(meal_type.lower(), np.zeros(len(self.recipes), dtype=bool))
+        if cuisine:
+            mask &= self.cuisine_masks.get(cuisine.lower(), np.zeros(len(self.recipes), dtype=bool))
+        return mask
+
+    def search(self, query: str = "", k: int = 5, **filters) -> List[dict]:
+        """
+        Return the top-k recipes for a free-text query under the given filters
+        (see filter_mask). An empty query returns matching recipes in corpus order.
+        """
+        mask = self.filter_mask(**filters)
+        tokens = tokenize(query)
+        if not tokens:
+            return [self.recipes[i] for i in np.flatnonzero(mask)[:k]]
+
+        ranked = self.index.top_k(tokens, mask, k)
+        return [self.recipes[i] for i in ranked]
+
+
+def import_recipes(source_path: str, corpus_path: str) -> dict:
+    """Normalize every record in source_path and append it to the corpus file."""
+    directory = os.path.dirname(corpus_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    source = os.path.splitext(os.path.basename(source_path))[0]
+    imported = skipped = 0
+    with open(corpus_path, "a", encoding="utf-8") as out:
+        for raw in read_records(source_path):
+            recipe = normalize_recipe(raw, source=source)
+            if recipe is None:
+                skipped += 1
+                continue
+            out.write(json.dumps(recipe) + "\n")
+            imported += 1
+    return {"imported": imported, "skipped": skipped}
+
+
+_recipe_store: Optional[RecipeStore] = None
+
+
+def get_recipe_store() -> RecipeStore:
+    """Return the process-wide RecipeStore loaded from the configured corpus."""
+    global _recipe_store
+    if _recipe_store is None:
+        path = load_config().get("data", {}).get("recipes_path", "./data/recipes.jsonl")
+        _recipe_store = RecipeStore.from_jsonl(path)
+        print(f"Loaded {len(_recipe_store.recipes)} recipes from {path}")
+    return _recipe_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import recipes into the local corpus.")
+    parser.add_argument("source", help="Dataset file (.csv, .json or .jsonl), e.g. Food.com RAW_recipes.csv")
+    parser.add_argument("--corpus", default=None, help="Corpus file to append to (defaults to data.recipes_path)")
+    args = parser.parse_args()
+    corpus = args.corpus or load_config().get("data", {}).get("recipes_path", "./data/recipes.jsonl")
+    print(import_recipes(args.source, corpus))
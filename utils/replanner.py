@@ -0,0 +1,98 @@
+from typing import List, Optional
+
+from utils.food_tags import (
+    canonical_allergens, detect_allergens, dietary_preference_rules, infer_diets, mentions,
+    religious_exclusions, strictest_pattern, tokenize,
+)
+from utils.nutrition_calculator import NutritionCalculator
+
+# Fields whose change reshapes the whole plan (or needs clinical reasoning): regenerate everything
+STRUCTURAL_FIELDS = ["meals_per_day", "plan_days", "medical_conditions", "medications"]
+# Fields that can only invalidate meals containing newly excluded ingredients
+EXCLUSION_FIELDS = ["dietary_pattern", "dietary_preferences", "allergies", "dislikes", "religious_restrictions"]
+# Fields that move the daily calorie and macro targets
+TARGET_FIELDS = ["age", "gender", "height_cm", "weight_kg", "activity_level", "goals"]
+# Soft preferences: existing meals never violate them, so they only shape newly generated meals
+PREFERENCE_FIELDS = ["likes", "cuisine_preferences", "budget", "cooking_skill"]
+MACRO_KEYS = ["calories", "protein_g", "carbs_g", "fats_g"]
+
+
+def changed_fields(old_request: dict, new_request: dict) -> List[str]:
+    """Request fields whose value differs between two profiles."""
+    return sorted(k for k in set(old_request) | set(new_request) if old_request.get(k) != new_request.get(k))
+
+
+def needs_full_replan(old_request: dict, new_request: dict) -> bool:
+    """
+    Whether an edit reshapes the whole plan: a structural field changed, or a dietary
+    preference with no per-ingredient rule (keto, low-carb) was added.
+    """
+    if set(changed_fields(old_request, new_request)) & set(STRUCTURAL_FIELDS):
+        return True
+    old = dietary_preference_rules(old_request.get("dietary_preferences") or [])["unsupported"]
+    new = dietary_preference_rules(new_request.get("dietary_preferences") or [])["unsupported"]
+    return bool({p.lower() for p in new} - {p.lower() for p in old})
+
+
+class ExclusionChecker:
+    """Flags ingredients a profile no longer allows, with the same keyword rules the recipe store uses."""
+
+    def __init__(self, request: dict):
+        rules = dietary_preference_rules(request.get("dietary_preferences") or [])
+        # Patterns we have no rules for (e.g. "flexitarian") are not checked, as in filter_mask
+        self.dietary_pattern = strictest_pattern([request.get("dietary_pattern"), rules["dietary_pattern"]]) or ""
+        self.allergens, leftovers = canonical_allergens(list(request.get("allergies") or []) + rules["allergies"])
+        terms = leftovers + list(request.get("dislikes") or []) + religious_exclusions(request.get("religious_restrictions") or [])
+        self.excluded = [term for term in terms if tokenize(term)]
+
+    def violation(self, ingredient: str) -> Optional[str]:
+        """Why an ingredient breaks the profile, or None when it is allowed."""
+        allergens = self.allergens & set(detect_allergens([ingredient]))
+        if allergens:
+            return f"{ingredient} contains {', '.join(sorted(allergens))}"
+        if self.dietary_pattern and self.dietary_pattern not in infer_diets([ingredient]):
+            return f"{ingredient} is not {self.dietary_pattern}"
+        for term in self.excluded:
+            if mentions([ingredient], term):
+                return f"{ingredient} is excluded ({term})"
+        return None
+
+
+def daily_targets(request: dict) -> dict:
+    return NutritionCalculator.calculate_daily_needs(
+        request["gender"], request["weight_kg"], request["height_cm"], request["age"],
+        request["activity_level"], request.get("goals"),
+    )
+
+
+def invalidated_meals(plan: dict, old_request: dict, new_request: dict, tolerance: float = 0.10) -> List[dict]:
+    """
+    Meals of a parsed plan (utils.plan_html.parse_plan) that no longer fit the new request.
+
+    A meal is invalidated when one of its ingredients breaks a new exclusion, or when
+    its calories drift more than `tolerance` from its share of the new daily target
+    (its share of the day as planned). Each entry carries the day, the meal's index
+    within the day, its label, the reason and the meal's new macro target.
+    """
+    changed = set(changed_fields(old_request, new_request))
+    checker = ExclusionChecker(new_request) if changed & set(EXCLUSION_FIELDS) else None
+    new_targets = daily_targets(new_request)
+
+    invalid = []
+    for day in plan["days"]:
+        meals = day["meals"]
+        day_calories = sum(m["calories"] or 0 for m in meals)
+        for index, meal in enumerate(meals):
+            share = (meal["calories"] / day_calories) if day_calories and meal["calories"] else 1 / len(meals)
+            target = {k: round(new_targets[k] * share) for k in MACRO_KEYS}
+
+            reason = None
+            if checker is not None:
+                reason = next(filter(None, (checker.violation(i["name"]) for i in meal["ingredients"])), None)
+            if reason is None and changed & set(TARGET_FIELDS) and meal["calories"]:
+                drift = abs(meal["calories"] - target["calories"]) / max(target["calories"], 1)
+                if drift > tolerance:
+                    reason = f"calorie target moved to {target['calories']} kcal"
+            if reason is not None:
+                invalid.append({"day": day["day"], "index": index, "meal": meal["meal"], "reason": reason, "target": target})
+    return invalid
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Optional
+
+from utils.config_loader import load_config
+
+
+class SharedCache:
+    """
+    SQLite-backed key/value cache shared by every worker process on the host.
+
+    Gunicorn forks several workers that do not share memory, so an in-process
+    dict would be duplicated (and cold) in each of them. A single SQLite file in
+    WAL mode gives concurrent readers plus one writer, which is all a result/tool
+    cache needs. Values are stored as JSON with an absolute expiry timestamp.
+    """
+
+    def __init__(self, path: str = "./cache/shared_cache.sqlite3", default_ttl: int = 3600):
+        self.path = path
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._purger: Optional[threading.Thread] = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Return a connection owned by the current process and thread.
+
+        Connections must never cross a fork, so the owning pid is checked and a
+        fresh connection is opened in each worker after gunicorn forks it.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(namespace: str, *parts: Any) -> str:
+        """Build a stable cache key from a namespace and JSON-serialisable parts."""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{namespace}:{digest}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None when missing or expired."""
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store value under key for ttl seconds (defaults to the cache TTL)."""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), expires_at),
+            )
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+    def get_or_set(self, key: str, producer: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        """
+        Return the cached value for key, calling producer and caching its result on a miss.
+        Results carrying an "error" key are returned but not cached.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = producer()
+        if not (isinstance(value, dict) and "error" in value):
+            self.set(key, value, ttl)
+        return value
+
+    def purge_expired(self) -> int:
+        """Delete expired rows and return how many were removed."""
+        cursor = self._connect().execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def _purge_loop(self, interval_seconds: int) -> None:
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                self.purge_expired()
+            except sqlite3.Error as e:
+                print(f"Shared cache purge failed: {e}")
+
+    def start_background_purge(self, interval_seconds: int = 900) -> None:
+        """Delete expired rows every interval_seconds from a daemon thread (once per process)."""
+        if self._purger is not None and self._purger.is_alive():
+            return
+        self._purger = threading.Thread(
+            target=self._purge_loop, args=(interval_seconds,), name="cache-purge", daemon=True
+        )
+        self._purger.start()
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> SharedCache:
+    """Return the process-wide SharedCache configured from config.yaml."""
+    global _shared_cache
+    if _shared_cache is None:
+        cache_config = load_config().get("cache", {})
+        _shared_cache = SharedCache(
+            path=os.getenv("SHARED_CACHE_PATH", cache_config.get("path", "./cache/shared_cache.sqlite3")),
+            default_ttl=int(cache_config.get("ttl_seconds", 3600)),
+        )
+    return _shared_cache
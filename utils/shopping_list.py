@@ -0,0 +1,210 @@
+import csv
+import html
+import math
+from typing import Dict, List, Optional, Tuple
+
+from utils.config_loader import load_config
+from utils.currency_converter import get_currency_converter
+from utils.plan_html import parse_ingredients
+from utils.substitution_engine import SubstitutionEngine, get_substitution_engine
+
+# Every unit we accept, mapped to (base unit, factor to the base unit)
+UNIT_ALIASES: Dict[str, Tuple[str, float]] = {
+    "g": ("g", 1.0), "gram": ("g", 1.0), "grams": ("g", 1.0), "gm": ("g", 1.0),
+    "kg": ("g", 1000.0), "kilogram": ("g", 1000.0), "kilograms": ("g", 1000.0),
+    "mg": ("g", 0.001), "oz": ("g", 28.35), "ounce": ("g", 28.35), "ounces": ("g", 28.35),
+    "lb": ("g", 453.6), "lbs": ("g", 453.6), "pound": ("g", 453.6), "pounds": ("g", 453.6),
+    "ml": ("ml", 1.0), "milliliter": ("ml", 1.0), "millilitre": ("ml", 1.0),
+    "l": ("ml", 1000.0), "liter": ("ml", 1000.0), "litre": ("ml", 1000.0),
+    "tsp": ("ml", 4.93), "teaspoon": ("ml", 4.93), "tbsp": ("ml", 14.79), "tablespoon": ("ml", 14.79),
+    "cup": ("ml", 240.0), "cups": ("ml", 240.0),
+    "pcs": ("pcs", 1.0), "pc": ("pcs", 1.0), "piece": ("pcs", 1.0), "pieces": ("pcs", 1.0),
+    "slice": ("pcs", 1.0), "slices": ("pcs", 1.0), "whole": ("pcs", 1.0), "clove": ("pcs", 1.0),
+    "cloves": ("pcs", 1.0), "large": ("pcs", 1.0), "medium": ("pcs", 1.0), "small": ("pcs", 1.0),
+}
+# Price table units in base units
+_PER_UNITS = {"kg": ("g", 1000.0), "l": ("ml", 1000.0), "pcs": ("pcs", 1.0)}
+
+
+def normalize_unit(quantity: Optional[float], unit: Optional[str]) -> Tuple[Optional[float], str]:
+    """Convert a quantity to grams, millilitres or pieces; unknown units count as pieces."""
+    base, factor = UNIT_ALIASES.get((unit or "pcs").strip().lower().rstrip("."), ("pcs", 1.0))
+    return (quantity * factor if quantity is not None else None), base
+
+
+def _convert(quantity: float, unit: str, target: str, grams_per_piece: float) -> Optional[float]:
+    """
+    Convert between base units. Grams and millilitres are treated as 1:1 (close enough
+    for a shopping estimate); pieces need the food's piece weight.
+    """
+    if unit == target:
+        return quantity
+    if "pcs" not in (unit, target):
+        return quantity
+    if not grams_per_piece:
+        return None
+    return quantity * grams_per_piece if unit == "pcs" else quantity / grams_per_piece
+
+
+class PriceTable:
+    """Local ingredient prices keyed by food-table name: price per kg, l or piece."""
+
+    def __init__(self, rows: List[dict]):
+        self.prices = {
+            row["name"]: (float(row["price"]), row["per"], row.get("currency") or "USD") for row in rows
+        }
+
+    @classmethod
+    def from_csv(cls, path: str) -> "PriceTable":
+        with open(path, newline="", encoding="utf-8") as file:
+            return cls(list(csv.DictReader(file)))
+
+    def cost(self, food_name: str, quantity: float, unit: str, grams_per_piece: float) -> Optional[Tuple[float, str]]:
+        """(amount, currency) for a quantity in base units, or None when it cannot be priced."""
+        if food_name not in self.prices:
+            return None
+        price, per, currency = self.prices[food_name]
+        per_unit, per_factor = _PER_UNITS.get(per, ("pcs", 1.0))
+        converted = _convert(quantity, unit, per_unit, grams_per_piece)
+        if converted is None:
+            return None
+        return price * converted / per_factor, currency
+
+
+class ShoppingListAggregator:
+    """
+    Merge the ingredients of every plan day into one priced shopping list.
+
+    Days can be added one at a time as their sections stream in (add_day), so a
+    7-day plan is aggregated while later days are still being generated. Names
+    are matched to the food table, quantities normalized to g/ml/pcs and merged
+    per food; costs come from the local price table and are converted into the
+    user's currency with the cached rate table.
+    """
+
+    def __init__(self, price_table: Optional[PriceTable] = None, engine: Optional[SubstitutionEngine] = None):
+        self.price_table = price_table or get_price_table()
+        self.engine = engine or get_substitution_engine()
+        # name -> lines for that food (one per unit that cannot be converted into another)
+        self.entries: Dict[str, List[dict]] = {}
+        self.days = 0
+
+    def add_ingredients(self, ingredients: List[dict]) -> None:
+        for ingredient in ingredients:
+            quantity, unit = normalize_unit(ingredient.get("quantity"), ingredient.get("unit"))
+            index = self.engine.match(ingredient["name"])
+            food = self.engine.names[index] if index is not None else None
+            grams_per_piece = float(self.engine.foods[index].get("grams_per_piece") or 0) if index is not None else 0.0
+            lines = self.entries.setdefault(food or ingredient["name"], [])
+
+            # Fold into an existing line for the same food when the units convert
+            for line in lines:
+                if quantity is None:
+                    break
+                if line["quantity"] is None:
+                    line.update(quantity=quantity, unit=unit)
+                    break
+                converted = _convert(quantity, unit, line["unit"], grams_per_piece)
+                if converted is not None:
+                    line["quantity"] += converted
+                    break
+            else:
+                lines.append({"food": food, "quantity": quantity, "unit": unit, "grams_per_piece": grams_per_piece})
+
+    def add_day(self, day_html: str) -> None:
+        """Aggregate one (complete) day section."""
+        self.add_ingredients(parse_ingredients(day_html))
+        self.days += 1
+
+    def summary(self, currency: str = "USD") -> dict:
+        """
+        Priced shopping list:
+        {"items": [{"name", "quantity", "unit", "cost"}], "total", "currency", "unpriced"}.
+        Falls back to the converter's base currency when the rate for `currency` is unknown;
+        items whose price currency has no rate yet are left unpriced.
+        """
+        priced = []
+        for name in sorted(self.entries):
+            for line in self.entries[name]:
+                cost = None
+                if line["food"] and line["quantity"] is not None:
+                    cost = self.price_table.cost(line["food"], line["quantity"], line["unit"], line["grams_per_piece"])
+                priced.append((name, line, cost))
+
+        converter = get_currency_converter()
+        currency = (currency or converter.base_currency).upper()
+        try:
+            costs = [converter.convert(*cost, currency) if cost else None for _, _, cost in priced]
+        except ValueError:
+            currency = converter.base_currency
+            costs = [_convert_or_none(converter, cost, currency) if cost else None for _, _, cost in priced]
+
+        items = [
+            {
+                "name": name,
+                "quantity": line["quantity"],
+                "unit": line["unit"],
+                "cost": round(cost, 2) if cost is not None else None,
+            }
+            for (name, line, _), cost in zip(priced, costs)
+        ]
+        return {
+            "items": items,
+            "total": round(sum(c for c in costs if c is not None), 2),
+            "currency": currency,
+            "unpriced": [item["name"] for item in items if item["cost"] is None],
+        }
+
+
+def _convert_or_none(converter, cost: tuple, currency: str) -> Optional[float]:
+    """The cost in `currency`, or None while the rate table has no rate for it (item stays unpriced)."""
+    try:
+        return converter.convert(*cost, currency)
+    except ValueError:
+        return None
+
+
+def _display_quantity(quantity: Optional[float], unit: str) -> str:
+    if quantity is None:
+        return "as needed"
+    if unit in ("g", "ml") and quantity >= 1000:
+        return f"{quantity / 1000:.2f} {'kg' if unit == 'g' else 'l'}"
+    if unit == "pcs":
+        return f"{math.ceil(quantity)} pcs"
+    return f"{round(quantity)} {unit}"
+
+
+def render_shopping_list(summary: dict, days: int = 1) -> str:
+    """Shopping list section appended after the day sections."""
+    def cost(item: dict) -> str:
+        return "" if item["cost"] is None else f"{item['cost']:.2f}"
+
+    rows = "".join(
+        f'<tr data-item="{html.escape(item["name"])}" class="border-t">'
+        f'<td class="py-1 pr-4">{html.escape(item["name"])}</td>'
+        f'<td class="py-1 pr-4">{_display_quantity(item["quantity"], item["unit"])}</td>'
+        f'<td class="py-1 text-right">{cost(item)}</td></tr>'
+        for item in summary["items"]
+    )
+    return (
+        f'<section data-shopping-list class="bg-white rounded-2xl shadow-md p-5 space-y-3">'
+        f'<h2 class="text-2xl font-bold text-gray-900">Shopping List ({days} day{"s" if days != 1 else ""})</h2>'
+        f'<table class="w-full text-sm"><thead><tr class="text-left text-gray-500">'
+        f'<th class="py-1 pr-4">Item</th><th class="py-1 pr-4">Quantity</th>'
+        f'<th class="py-1 text-right">Est. cost ({html.escape(summary["currency"])})</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table>'
+        f'<p class="text-sm font-semibold text-gray-800">Estimated total: {summary["total"]:.2f} {html.escape(summary["currency"])}</p>'
+        f'</section>'
+    )
+
+
+_price_table: Optional[PriceTable] = None
+
+
+def get_price_table() -> PriceTable:
+    """Return the process-wide PriceTable loaded from the configured CSV."""
+    global _price_table
+    if _price_table is None:
+        path = load_config().get("data", {}).get("prices_path", "./data/prices.csv")
+        _price_table = PriceTable.from_csv(path)
+    return _price_table
@@ -0,0 +1,181 @@
+import csv
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.config_loader import load_config
+from utils.food_tags import DIETARY_PATTERNS, canonical_allergens, mentions, normalize_word, tokenize
+
+# Which dietary patterns still allow a food, keyed by its "animal" column
+_DIETS_BY_ANIMAL = {
+    "meat": ["omnivore"],
+    "fish": ["omnivore", "pescatarian"],
+    "egg": ["omnivore", "pescatarian", "eggetarian"],
+    "dairy": ["omnivore", "pescatarian", "eggetarian", "vegetarian"],
+    "honey": ["omnivore", "pescatarian", "eggetarian", "vegetarian"],
+    "": DIETARY_PATTERNS,
+}
+_MICRO_COLUMNS = ["fiber_g", "sugar_g", "sodium_mg", "calcium_mg", "iron_mg", "vitamin_c_mg"]
+# Categories that only ever substitute for each other (soy sauce is not a protein swap)
+_CLOSED_CATEGORIES = {"condiment", "sweetener", "fat"}
+
+
+class SubstitutionEngine:
+    """
+    Nearest-neighbour food substitutions over normalized nutrient vectors.
+
+    Each food becomes a vector of its protein/carb/fat energy shares plus
+    micronutrients per 100 kcal (log-scaled), standardized per column, with the
+    macro columns weighted up. Substitutes for every ingredient of a plan are
+    found with one (ingredients x foods) distance matrix, after masking out foods
+    that break the user's diet, allergies or dislikes.
+    """
+
+    MACRO_WEIGHT = 2.0
+    # Foods of another category are only offered within this squared distance...
+    MAX_CROSS_CATEGORY_DISTANCE = 3.0
+    # ...and rank after every allowed food of the ingredient's own category
+    CATEGORY_PENALTY = 1e4
+
+    def __init__(self, foods: List[dict]):
+        self.foods = foods
+        self.names = [f["name"] for f in foods]
+        self._name_index = {normalize_word(n): i for i, n in enumerate(self.names)}
+        self._name_tokens = [set(tokenize(n)) for n in self.names]
+        self._match_cache: Dict[str, Optional[int]] = {}
+
+        kcal = np.array([max(float(f["calories"]), 1.0) for f in foods], dtype=np.float64)
+        macros = np.column_stack([
+            np.array([float(f["protein_g"]) for f in foods]) * 4 / kcal,
+            np.array([float(f["carbs_g"]) for f in foods]) * 4 / kcal,
+            np.array([float(f["fats_g"]) for f in foods]) * 9 / kcal,
+        ])
+        micros = np.column_stack([
+            np.log1p(np.array([float(f[c]) for f in foods]) * 100 / kcal) for c in _MICRO_COLUMNS
+        ])
+        features = np.hstack([macros, micros])
+        std = features.std(axis=0)
+        std[std == 0] = 1.0
+        features = (features - features.mean(axis=0)) / std
+        features[:, :3] *= self.MACRO_WEIGHT
+        self.vectors = features.astype(np.float32)
+        self.squared_norms = (self.vectors ** 2).sum(axis=1)
+
+        categories = sorted({f["category"] for f in foods})
+        self.categories = np.array([categories.index(f["category"]) for f in foods])
+        self.closed = np.array([f["category"] in _CLOSED_CATEGORIES for f in foods])
+
+        n = len(foods)
+        self.diet_masks = {p: np.zeros(n, dtype=bool) for p in DIETARY_PATTERNS}
+        self.allergen_masks: Dict[str, np.ndarray] = {}
+        for i, food in enumerate(foods):
+            for diet in _DIETS_BY_ANIMAL.get(food.get("animal", ""), DIETARY_PATTERNS):
+                self.diet_masks[diet][i] = True
+            for allergen in filter(None, (food.get("allergens") or "").split(";")):
+                self.allergen_masks.setdefault(allergen, np.zeros(n, dtype=bool))[i] = True
+
+    @classmethod
+    def from_csv(cls, path: str) -> "SubstitutionEngine":
+        """Load the per-100 g food table."""
+        with open(path, newline="", encoding="utf-8") as file:
+            return cls(list(csv.DictReader(file)))
+
+    def match(self, ingredient: str) -> Optional[int]:
+        """
+        Index of the food best matching an ingredient name: exact name first,
+        then the largest token overlap (at least half the food's tokens).
+        """
+        key = normalize_word(ingredient.strip().lower())
+        if key in self._match_cache:
+            return self._match_cache[key]
+        index = self._name_index.get(key)
+        if index is None:
+            tokens = set(tokenize(ingredient))
+            best_score = 0.0
+            for i, food_tokens in enumerate(self._name_tokens):
+                overlap = len(tokens & food_tokens)
+                score = overlap / len(food_tokens) if food_tokens else 0.0
+                if overlap and score >= 0.5 and score > best_score:
+                    index, best_score = i, score
+        self._match_cache[key] = index
+        return index
+
+    def allowed_mask(
+        self,
+        dietary_pattern: Optional[str] = None,
+        allergies: Optional[List[str]] = None,
+        dislikes: Optional[List[str]] = None,
+    ) -> np.ndarray:
+        """Foods the user may be offered as substitutes."""
+        mask = np.ones(len(self.foods), dtype=bool)
+        if dietary_pattern and dietary_pattern.lower() in self.diet_masks:
+            mask &= self.diet_masks[dietary_pattern.lower()]
+        allergens, leftovers = canonical_allergens(allergies or [])
+        for allergen in allergens:
+            if allergen in self.allergen_masks:
+                mask &= ~self.allergen_masks[allergen]
+        for term in leftovers + list(dislikes or []):
+            if not tokenize(term):
+                continue
+            for i, name in enumerate(self.names):
+                if mentions([name], term):
+                    mask[i] = False
+        return mask
+
+    def substitutes(
+        self,
+        ingredients: List[str],
+        k: int = 3,
+        dietary_pattern: Optional[str] = None,
+        allergies: Optional[List[str]] = None,
+        dislikes: Optional[List[str]] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        Up to k substitutes for each ingredient, closest nutrient profile first.
+        Foods of the same category come first; other categories only fill the
+        remaining places, and only when their profile is close.
+        Ingredients that cannot be matched to the food table are left out.
+        """
+        matched = [(name, self.match(name)) for name in ingredients]
+        matched = [(name, index) for name, index in matched if index is not None]
+        if not matched:
+            return {}
+
+        query_ids = np.array([index for _, index in matched])
+        queries = self.vectors[query_ids]
+        # ||q - v||^2 for every (ingredient, food) pair in one matrix product
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None]
+            + self.squared_norms[None, :]
+            - 2.0 * queries @ self.vectors.T
+        )
+        different = self.categories[query_ids][:, None] != self.categories[None, :]
+        distances[different & (distances > self.MAX_CROSS_CATEGORY_DISTANCE)] = np.inf
+        distances += self.CATEGORY_PENALTY * different
+        distances[different & (self.closed[query_ids][:, None] | self.closed[None, :])] = np.inf
+        distances[:, ~self.allowed_mask(dietary_pattern, allergies, dislikes)] = np.inf
+        distances[np.arange(len(query_ids)), query_ids] = np.inf
+
+        k = min(k, len(self.foods) - 1)
+        nearest = np.argpartition(distances, k, axis=1)[:, :k]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+
+        results = {}
+        for row, (name, _) in enumerate(matched):
+            results[name] = [
+                self.names[j] for j in nearest[row] if np.isfinite(distances[row, j])
+            ]
+        return results
+
+
+_substitution_engine: Optional[SubstitutionEngine] = None
+
+
+def get_substitution_engine() -> SubstitutionEngine:
+    """Return the process-wide SubstitutionEngine loaded from the configured food table."""
+    global _substitution_engine
+    if _substitution_engine is None:
+        path = load_config().get("data", {}).get("foods_path", "./data/foods.csv")
+        _substitution_engine = SubstitutionEngine.from_csv(path)
+    return _substitution_engine